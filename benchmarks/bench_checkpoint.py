@@ -0,0 +1,51 @@
+"""
+Memory and time of reverse mode through an unrolled explicit Euler
+integrator, with and without gradient checkpointing.
+
+Usage: python benchmarks/bench_checkpoint.py [steps] [size]
+"""
+import sys
+import time
+import tracemalloc
+import numpy as np
+from lazydiff import ops
+from lazydiff.vars import Var
+from lazydiff.checkpointing import checkpoint
+
+def euler(x, steps, dt=0.01):
+    for _ in range(steps):
+        x = x + dt * ops.sin(x)
+    return x
+
+def plain(x, steps):
+    return euler(x, steps)
+
+def checkpointed(x, steps):
+    segment = max(1, int(np.sqrt(steps)))
+    done = 0
+    while done < steps:
+        n = min(segment, steps - done)
+        x = checkpoint(lambda v, n=n: euler(v, n), x)
+        done += n
+    return x
+
+def run(build, steps, size):
+    tracemalloc.start()
+    start = time.perf_counter()
+    x = Var(np.linspace(0, 1, size))
+    y = ops.sum(build(x, steps))
+    y.backward()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, y.grad(x)
+
+if __name__ == '__main__':
+    steps = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    t_plain, m_plain, g_plain = run(plain, steps, size)
+    t_ckpt, m_ckpt, g_ckpt = run(checkpointed, steps, size)
+    assert np.allclose(g_plain, g_ckpt)
+    print('steps={} size={}'.format(steps, size))
+    print('plain:        {:8.3f} s  peak {:8.1f} MB'.format(t_plain, m_plain / 2**20))
+    print('checkpointed: {:8.3f} s  peak {:8.1f} MB'.format(t_ckpt, m_ckpt / 2**20))
@@ -0,0 +1,51 @@
+"""
+Time of a 5-fold cross-validated search over lasso regularization weights,
+fitting the folds one after the other in this process and with
+CrossValidation over an increasing number of processes. Per-fold fit times
+are reported for the largest pool.
+
+Usage: python benchmarks/bench_cross_validation.py [rows] [features] [values]
+"""
+import sys
+import time
+import functools
+import multiprocessing
+import numpy as np
+from lazydiff.vars import Var
+from lazydiff import regression
+from lazydiff.parallel import CrossValidation
+
+def serial_search(X, y, candidates, folds, **kwargs):
+    bounds = np.linspace(0, len(y), folds + 1).astype(int)
+    for loss_function in candidates:
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            train = np.r_[0:start, stop:len(y)]
+            m, b, _ = regression.iterative_regression(X[train], y[train], Var(np.ones(X.shape[1])), Var(0.),
+                                                      loss_function, **kwargs)
+            regression.MSE(X[start:stop], y[start:stop], m, b)
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    features = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    values = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    X = np.random.rand(rows, features)
+    y = X @ np.random.rand(features)
+    candidates = [functools.partial(regression.lasso_loss, C=C) for C in np.logspace(-1, -3, values)]
+    kwargs = {'lr': 0.5, 'epochs': 20, 'forward': False}
+    start = time.perf_counter()
+    serial_search(X, y, candidates, 5, **kwargs)
+    serial = time.perf_counter() - start
+    print('rows={} features={} values of C={}'.format(rows, features, values))
+    print('serial:      {:8.3f} s'.format(serial))
+    processes = 1
+    while processes <= multiprocessing.cpu_count():
+        with CrossValidation(X, y, folds=5, processes=processes) as cv:
+            start = time.perf_counter()
+            results = cv.search(candidates, Var(np.ones(features)), Var(0.), score_function=regression.MSE,
+                                **kwargs)
+            elapsed = time.perf_counter() - start
+        print('{:2d} processes: {:7.3f} s  speedup {:5.2f}'.format(processes, elapsed, serial / elapsed))
+        processes *= 2
+    for candidate, result in zip(candidates, results):
+        print('C={:.4f} mean score {:.3e} fold times {}'.format(candidate.keywords['C'], result['score'].mean(),
+                                                           ' '.join('{:.2f}'.format(t) for t in result['time'])))
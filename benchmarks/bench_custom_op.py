@@ -0,0 +1,48 @@
+"""
+Time and graph size of the gradient of a loss through the solution of a
+diagonally dominant linear system, solved by Jacobi iterations traced with
+lazydiff operations and by numpy.linalg.solve wrapped in ops.custom_op
+with an adjoint solve as vjp.
+
+Usage: python benchmarks/bench_custom_op.py [size] [iterations]
+"""
+import sys
+import time
+import numpy as np
+from lazydiff.vars import Var, gradients
+from lazydiff import ops
+
+def _solve_vjp(cotangent, x, A, b):
+    grad_b = np.linalg.solve(A.T, cotangent)
+    return -np.outer(grad_b, x), grad_b
+
+solve = ops.custom_op(np.linalg.solve, vjp=_solve_vjp)
+
+def jacobi(A, b, iterations):
+    diagonal = np.diag(A)
+    rest = A - np.diag(diagonal)
+    x = b / diagonal
+    for _ in range(iterations):
+        x = (b - ops.matmul(rest, x)) / diagonal
+    return x
+
+def measure(fn, size, repeats=3):
+    best = float('inf')
+    for _ in range(repeats):
+        b = Var(np.linspace(1, 2, size))
+        start = time.perf_counter()
+        loss = ops.sum(fn(b) ** 2)
+        grad = gradients(loss, [b], 'reverse')[0]
+        best = min(best, time.perf_counter() - start)
+    return grad, best, len(loss._topological_order(False))
+
+if __name__ == '__main__':
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    A = np.random.rand(size, size) + size * np.eye(size)
+    print('size={} iterations={}'.format(size, iterations))
+    expected, elapsed, nodes = measure(lambda b: jacobi(A, b, iterations), size)
+    print('traced Jacobi: {:8.4f} s  {:6d} nodes'.format(elapsed, nodes))
+    grad, elapsed, nodes = measure(lambda b: solve(A, b), size)
+    print('custom_op:     {:8.4f} s  {:6d} nodes'.format(elapsed, nodes))
+    print('max relative difference {:.1e}'.format(np.max(np.abs(grad - expected) / np.abs(expected))))
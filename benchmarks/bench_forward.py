@@ -0,0 +1,40 @@
+"""
+Time to compute the gradient of MSE with respect to m and b with one
+forward sweep per parameter, with one batched forward sweep and with
+reverse mode, for an increasing number of features.
+
+Usage: python benchmarks/bench_forward.py [rows]
+"""
+import sys
+import time
+import numpy as np
+from lazydiff.vars import Var, gradients
+from lazydiff import regression
+
+def per_parameter(loss, m, b):
+    m.forward()
+    b.forward()
+    return loss.grad(m), loss.grad(b)
+
+def best_time(X, y, compute, repeats=3):
+    best = float('inf')
+    for _ in range(repeats):
+        m = Var(np.ones(X.shape[1]))
+        b = Var(0.)
+        loss = regression.MSE(X, y, m, b)
+        start = time.perf_counter()
+        compute(loss, m, b)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    print('rows={}'.format(rows))
+    print('features  per parameter  batched forward  reverse')
+    for features in (1, 4, 16, 64, 256):
+        X = np.random.rand(rows, features)
+        y = X @ np.random.rand(features)
+        times = [best_time(X, y, per_parameter),
+                 best_time(X, y, lambda loss, m, b: gradients(loss, [m, b], 'forward')),
+                 best_time(X, y, lambda loss, m, b: gradients(loss, [m, b], 'reverse'))]
+        print('{:8d}  {:11.4f} s  {:13.4f} s  {:5.4f} s'.format(features, *times))
@@ -0,0 +1,41 @@
+"""
+Throughput of one loss and gradient evaluation of the vectorized
+logistic, Poisson and softmax regression losses on synthetic data.
+
+Usage: python benchmarks/bench_glm.py [features] [classes]
+"""
+import sys
+import time
+import numpy as np
+from lazydiff.vars import Var, gradients
+from lazydiff import regression
+
+def best_time(X, y, loss_function, m_shape, b_shape, repeats=3):
+    best = float('inf')
+    for _ in range(repeats):
+        m = Var(np.zeros(m_shape))
+        b = Var(np.zeros(b_shape))
+        start = time.perf_counter()
+        gradients(loss_function(X, y, m, b), [m, b])
+        best = min(best, time.perf_counter() - start)
+    return best
+
+if __name__ == '__main__':
+    features = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    classes = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    rng = np.random.default_rng(0)
+    print('features={} classes={}'.format(features, classes))
+    print('rows      loss      time       rows/s')
+    for rows in (100000, 1000000):
+        X = rng.normal(size=(rows, features))
+        z = X @ rng.normal(size=features) / np.sqrt(features)
+        cases = [
+            ('logistic', (rng.random(rows) < 1 / (1 + np.exp(-z))).astype(float),
+             regression.logistic_loss, features, ()),
+            ('poisson', rng.poisson(np.exp(z)), regression.poisson_loss, features, ()),
+            ('softmax', rng.integers(classes, size=rows), regression.softmax_loss,
+             (features, classes), classes),
+        ]
+        for name, y, loss_function, m_shape, b_shape in cases:
+            elapsed = best_time(X, y, loss_function, m_shape, b_shape)
+            print('{:8d}  {:8s}  {:7.3f} s  {:10.3g}'.format(rows, name, elapsed, rows / elapsed))
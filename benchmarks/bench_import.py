@@ -0,0 +1,31 @@
+"""
+Time to start a Python process that imports lazydiff, compared with one
+that does nothing and one that only imports NumPy.
+
+Usage: python benchmarks/bench_import.py [repeats]
+"""
+import sys
+import subprocess
+import time
+
+STATEMENTS = [
+    ('python', 'pass'),
+    ('numpy', 'import numpy'),
+    ('lazydiff', 'import lazydiff'),
+    ('lazydiff.Var', 'from lazydiff import Var'),
+    ('lazydiff.ops', 'from lazydiff import ops'),
+    ('lazydiff.regression', 'from lazydiff import regression'),
+]
+
+def startup_time(statement, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', statement], check=True)
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2]
+
+if __name__ == '__main__':
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 11
+    for name, statement in STATEMENTS:
+        print('{:20s} {:8.1f} ms'.format(name, 1000 * startup_time(statement, repeats)))
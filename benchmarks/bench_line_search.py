@@ -0,0 +1,40 @@
+"""
+Number of epochs and loss evaluations needed by iterative_regression to
+reach a gradient norm tolerance with a fixed step size, backtracking line
+search and Barzilai-Borwein step sizes, on badly scaled features.
+
+Usage: python benchmarks/bench_line_search.py [rows] [features]
+"""
+import sys
+import time
+import numpy as np
+import scipy.sparse
+from lazydiff.vars import Var
+from lazydiff import regression
+
+def run(X, y, step, lr, epochs=20000, gtol=1e-6):
+    calls = [0]
+    def loss_function(X, y, m, b):
+        calls[0] += 1
+        return regression.MSE(X, y, m, b)
+    monitor = regression.Monitor(epochs, gtol=gtol)
+    start = time.perf_counter()
+    try:
+        regression.iterative_regression(X, y, Var(np.zeros(X.shape[1])), Var(0.), loss_function,
+                                        lr, epochs, 0, False, callback=monitor, step=step)
+    except FloatingPointError:
+        return 'diverged', calls[0], time.perf_counter() - start
+    return monitor.count, calls[0], time.perf_counter() - start
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    features = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    rng = np.random.default_rng(0)
+    dense = rng.normal(size=(rows, features)) * np.logspace(-0.5, 0.5, features)
+    X = scipy.sparse.csr_matrix(dense)
+    y = dense @ rng.normal(size=features) + 3
+    print('rows={} features={}'.format(rows, features))
+    print('step    lr      epochs  evaluations  time')
+    for step, lr in [('fixed', 0.04), ('fixed', 0.2), ('armijo', 1.), ('bb', 0.04)]:
+        epochs, calls, elapsed = run(X, y, step, lr)
+        print('{:6s}  {:5.3f}  {:>8}  {:11d}  {:6.2f} s'.format(step, lr, epochs, calls, elapsed))
@@ -0,0 +1,38 @@
+"""
+Time of one gradient descent step on MSE, serially and with DataParallel
+over an increasing number of processes.
+
+Usage: python benchmarks/bench_parallel.py [rows] [features]
+"""
+import sys
+import time
+import multiprocessing
+import numpy as np
+from lazydiff.vars import Var
+from lazydiff import regression
+from lazydiff.parallel import DataParallel
+
+def step_time(X, y, loss_function, repeats=3):
+    best = float('inf')
+    for _ in range(repeats):
+        m = Var(np.ones(X.shape[1]))
+        b = Var(0.)
+        start = time.perf_counter()
+        regression.gradient_descent(X, y, loss_function, m, b, forward=False)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    features = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    X = np.random.rand(rows, features)
+    y = X @ np.random.rand(features)
+    serial = step_time(X, y, regression.MSE)
+    print('rows={} features={}'.format(rows, features))
+    print('serial:      {:8.3f} s'.format(serial))
+    processes = 1
+    while processes <= multiprocessing.cpu_count():
+        with DataParallel(X, y, processes=processes) as dp:
+            elapsed = step_time(X, y, dp.wrap(regression.MSE))
+        print('{:2d} processes: {:7.3f} s  speedup {:5.2f}'.format(processes, elapsed, serial / elapsed))
+        processes *= 2
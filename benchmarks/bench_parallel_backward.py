@@ -0,0 +1,43 @@
+"""
+Time of the reverse sweep over a wide graph of independent branches on
+large vectors, with Var.backward and with parallel_backward.
+
+Usage: python benchmarks/bench_parallel_backward.py [branches] [size]
+"""
+import gc
+import sys
+import time
+import multiprocessing
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from lazydiff import ops
+from lazydiff.vars import Var
+from lazydiff.parallel import parallel_backward
+
+def wide(x, branches):
+    total = 0.
+    for k in range(1, branches + 1):
+        total = ops.sin(ops.exp(x / k) * k) ** 2 + total
+    return ops.sum(total)
+
+def sweep_time(backward, branches, size, repeats=3):
+    best = float('inf')
+    for _ in range(repeats):
+        x = Var(np.linspace(0, 1, size))
+        y = wide(x, branches)
+        start = time.perf_counter()
+        backward(y)
+        best = min(best, time.perf_counter() - start)
+        del x, y
+        gc.collect()
+    return best
+
+if __name__ == '__main__':
+    branches = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+    serial = sweep_time(lambda y: y.backward(), branches, size)
+    print('branches={} size={} cpus={}'.format(branches, size, multiprocessing.cpu_count()))
+    print('backward:          {:8.3f} s'.format(serial))
+    with ThreadPoolExecutor(multiprocessing.cpu_count()) as executor:
+        parallel = sweep_time(lambda y: parallel_backward(y, executor), branches, size)
+    print('parallel_backward: {:8.3f} s  speedup {:5.2f}'.format(parallel, serial / parallel))
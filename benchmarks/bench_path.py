@@ -0,0 +1,48 @@
+"""
+Time and epochs to fit L2 regularized mean squared error for a decreasing
+sequence of regularization weights with warm starts, compared with
+independent fits all starting from the same point.
+
+Usage: python benchmarks/bench_path.py [rows] [features] [values]
+"""
+import sys
+import functools
+import time
+import numpy as np
+import scipy.sparse
+from lazydiff.vars import Var
+from lazydiff import regression
+
+# gradient descent does not settle on coefficients the L1 norm sets to zero,
+# so the L2 penalty is used to let every fit stop on the tolerance
+loss_function = functools.partial(regression.MSE_regularized, p=2)
+
+def cold_path(X, y, Cs, **kwargs):
+    epochs = 0
+    for C in Cs:
+        path = regression.regularization_path(X, y, loss_function, [C], Var(np.ones(X.shape[1])),
+                                              Var(0.), **kwargs)
+        epochs += path['epochs'][0]
+    return epochs
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    features = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    values = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    rng = np.random.default_rng(0)
+    # correlated features make each fit take more than a few epochs
+    dense = rng.normal(size=(rows, features)) + rng.normal(size=(rows, 1))
+    y = dense @ rng.normal(size=features) + 1 + rng.normal(size=rows)
+    X = scipy.sparse.csr_matrix(dense)
+    Cs = np.logspace(-1, -4, values)
+    kwargs = {'lr': 0.05, 'epochs': 5000, 'tol': 1e-8}
+    start = time.perf_counter()
+    path = regression.regularization_path(X, y, loss_function, Cs, Var(np.ones(features)),
+                                          Var(0.), **kwargs)
+    warm = time.perf_counter() - start
+    start = time.perf_counter()
+    cold_epochs = cold_path(X, y, Cs, **kwargs)
+    cold = time.perf_counter() - start
+    print('rows={} features={} values of C={}'.format(rows, features, values))
+    print('warm start:  {:6d} epochs  {:6.2f} s'.format(path['epochs'].sum(), warm))
+    print('independent: {:6d} epochs  {:6.2f} s'.format(cold_epochs, cold))
@@ -0,0 +1,51 @@
+"""
+Peak memory and time of one reverse mode gradient of the squared error of
+a polynomial regression, with the expanded design matrix materialized by
+sklearn's PolynomialFeatures and with features expanded per chunk by
+ops.polynomial_matmul.
+
+Usage: python benchmarks/bench_polynomial.py [rows] [features] [degree] [chunk_size]
+"""
+import sys
+import time
+import tracemalloc
+import numpy as np
+from sklearn.preprocessing import PolynomialFeatures
+from lazydiff.vars import Var
+from lazydiff import ops
+
+def materialized(X, y, m, degree, chunk_size):
+    expanded = PolynomialFeatures(degree, include_bias=False).fit_transform(X)
+    loss = ops.squared_error(ops.matmul(expanded, m), y)
+    loss.backward()
+    return loss.grad(m)
+
+def chunked(X, y, m, degree, chunk_size):
+    loss = ops.squared_error(ops.polynomial_matmul(X, m, degree, chunk_size=chunk_size), y)
+    loss.backward()
+    return loss.grad(m)
+
+def measure(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    grad = fn(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return grad, elapsed, peak
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    features = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    degree = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    chunk_size = int(sys.argv[4]) if len(sys.argv) > 4 else 1024
+    X = np.random.rand(rows, features)
+    y = np.random.rand(rows)
+    terms = len(ops.polynomial_terms(features, degree))
+    m = Var(np.random.rand(terms))
+    print('rows={} features={} degree={} terms={} chunk_size={}'.format(rows, features, degree, terms, chunk_size))
+    expected, elapsed, peak = measure(materialized, X, y, m, degree, chunk_size)
+    print('materialized: {:7.2f} s  peak {:8.1f} MB'.format(elapsed, peak / 2 ** 20))
+    grad, elapsed, peak = measure(chunked, X, y, m, degree, chunk_size)
+    print('chunked:      {:7.2f} s  peak {:8.1f} MB'.format(elapsed, peak / 2 ** 20))
+    print('max relative difference {:.1e}'.format(np.max(np.abs(grad - expected) / np.abs(expected))))
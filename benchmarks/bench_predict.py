@@ -0,0 +1,37 @@
+"""
+Rows per second predicted by a fitted linear model: with Var arithmetic one
+row at a time, with one vectorized Var graph for all rows, and with
+LinearModel.predict on the whole matrix and in chunks.
+
+Usage: python benchmarks/bench_predict.py [rows] [features] [chunk_size]
+"""
+import sys
+import time
+import numpy as np
+from lazydiff.vars import Var
+from lazydiff import ops
+from lazydiff import regression
+
+def rate(fn, rows, repeats=3):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return rows / best
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2000000
+    features = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    chunk_size = int(sys.argv[3]) if len(sys.argv) > 3 else 65536
+    X = np.random.rand(rows, features)
+    m = Var(np.random.rand(features))
+    b = Var(1.)
+    model = regression.LinearModel(m, b)
+    sample = X[:10000]
+    print('rows={} features={} chunk_size={}'.format(rows, features, chunk_size))
+    print('Var per row:      {:12.0f} rows/s'.format(rate(lambda: [ops.sum(m * row) + b for row in sample],
+                                                             len(sample), 1)))
+    print('Var vectorized:   {:12.0f} rows/s'.format(rate(lambda: regression._linear(X, m, b), rows)))
+    print('predict:          {:12.0f} rows/s'.format(rate(lambda: model.predict(X), rows)))
+    print('predict chunked:  {:12.0f} rows/s'.format(rate(lambda: model.predict(X, chunk_size), rows)))
@@ -0,0 +1,43 @@
+"""
+lazydiff: automatic differentiation with lazy graph construction.
+Submodules and the names below are imported on first access, so importing
+lazydiff itself is cheap and has no side effects.
+"""
+import importlib
+
+_submodules = ['checkpointing', 'jacobian', 'ops', 'optimize', 'parallel', 'regression',
+               'serialize', 'service', 'vars']
+
+_names = {
+    'Var': 'vars',
+    'Partial': 'vars',
+    'Tape': 'vars',
+    'set_default_dtype': 'vars',
+    'get_default_dtype': 'vars',
+    'set_error_policy': 'vars',
+    'get_error_policy': 'vars',
+    'error_policy': 'vars',
+    'custom_op': 'ops',
+    'checkpoint': 'checkpointing',
+    'agrad': 'service',
+}
+
+__all__ = list(_names)
+
+def __getattr__(name):
+    """
+    Imports submodule name, or the submodule defining name, on first access
+    """
+    if name in _submodules:
+        return importlib.import_module('lazydiff.' + name)
+    if name in _names:
+        value = getattr(importlib.import_module('lazydiff.' + _names[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module 'lazydiff' has no attribute '{}'".format(name))
+
+def __dir__():
+    """
+    Returns the names available from lazydiff, including those not imported yet
+    """
+    return sorted(set(globals()) | set(_submodules) | set(_names))
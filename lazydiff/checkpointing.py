@@ -0,0 +1,142 @@
+import numpy as np
+from lazydiff.vars import Var, Partial, _graph_changed, _operation
+
+class _Segment:
+    """
+    Recomputable segment of a computation. Only the function and the values
+    at the segment boundary are stored; the graph inside the segment is
+    rebuilt every time derivatives need to be propagated through it.
+    """
+
+    def __init__(self, fn, vals):
+        """
+        Initializes segment computing fn from input values vals
+        """
+        self.fn = fn
+        self.vals = vals
+        self.cache = None
+
+    def _rebuild(self):
+        """
+        Rebuilds the graph of the segment on fresh copies of its inputs.
+        Returns the copies and the output of the segment.
+        """
+        copies = [Var(val) for val in self.vals]
+        output = self.fn(*copies)
+        if not isinstance(output, Var):
+            raise TypeError('Checkpointed function needs to return Var object.')
+        return copies, output
+
+    def _release(self, copies):
+        """
+        Breaks the reference cycles of the graph rebuilt on copies so that
+        its memory is returned as soon as the segment has been used.
+        """
+        seen = set(copies)
+        stack = list(copies)
+        while stack:
+            for child in stack.pop().children.keys():
+                if child not in seen:
+                    seen.add(child)
+                    stack.append(child)
+        for var in seen:
+            for parent in var.parents.keys():
+                if parent not in seen:
+                    parent.children.pop(var, None)
+            var.parents.clear()
+            var.children.clear()
+            var.grad_val.clear()
+        _graph_changed()
+
+    def jvp(self, index, tangent):
+        """
+        Recomputes the segment and propagates tangent forward from its
+        input at position index. The tangents of a batch along leading axes
+        are propagated one at a time through the same rebuilt graph.
+        """
+        copies, output = self._rebuild()
+        copy = copies[index]
+        batch = np.shape(tangent)[:max(np.ndim(tangent) - np.ndim(copy.val), 0)]
+        columns = np.reshape(tangent, (-1,) + np.shape(tangent)[len(batch):]) if batch else [tangent]
+        grads = []
+        for column in columns:
+            copy.grad_val[copy] = column
+            copy.forward()
+            grads.append(output.grad_val.get(copy, 0.))
+        self._release(copies)
+        if not batch:
+            return grads[0]
+        grads = np.broadcast_arrays(np.zeros(output.val.shape), *grads)[1:]
+        return np.reshape(grads, batch + np.shape(grads[0]))
+
+    def vjp(self, cotangent):
+        """
+        Recomputes the segment and propagates cotangent backward to all of
+        its inputs. The result is cached for the last cotangent seen, since
+        backward asks for it once per input of the segment.
+        """
+        if self.cache is None or self.cache[0] is not cotangent:
+            copies, output = self._rebuild()
+            output.grad_val[output] = cotangent
+            output.backward()
+            self.cache = (cotangent, [output.grad_val.get(copy, 0.) for copy in copies])
+            self._release(copies)
+        return self.cache[1]
+
+class _SegmentPartial(Partial):
+    """
+    Partial derivative of a checkpointed segment with respect to one of its
+    inputs, which may appear at several positions indices.
+    """
+
+    def __init__(self, segment, indices):
+        """
+        Initializes partial for the inputs of segment at positions indices
+        """
+        self.segment = segment
+        self.indices = indices
+
+    def jvp(self, tangent):
+        """
+        Returns tangent propagated through the segment
+        """
+        grad = 0.
+        for index in self.indices:
+            grad = grad + self.segment.jvp(index, tangent)
+        return grad
+
+    def vjp(self, cotangent):
+        """
+        Returns cotangent propagated back through the segment
+        """
+        grads = self.segment.vjp(cotangent)
+        grad = 0.
+        for index in self.indices:
+            grad = grad + grads[index]
+        return grad
+
+@_operation
+def checkpoint(fn, *vars):
+    """
+    Returns variable representing fn applied to the input variables vars,
+    without keeping the intermediate variables created by fn alive.
+    The intermediate variables are recomputed whenever derivatives are
+    propagated through the segment, trading computation for memory.
+    Chaining checkpoints over segments of about sqrt(N) steps of an N step
+    computation keeps memory usage proportional to sqrt(N).
+    Derivatives only flow through the arguments of fn, so fn should not
+    use any other variables than vars.
+    """
+    for var in vars:
+        if not isinstance(var, Var):
+            raise TypeError('Inputs needs to be Var object.')
+    segment = _Segment(fn, [var.val for var in vars])
+    copies, output = segment._rebuild()
+    result = Var(output.val)
+    segment._release(copies)
+    indices = {}
+    for index, var in enumerate(vars):
+        indices.setdefault(var, []).append(index)
+    for var, var_indices in indices.items():
+        result.parents[var] = var.children[result] = _SegmentPartial(segment, var_indices)
+    return result
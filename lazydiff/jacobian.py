@@ -0,0 +1,239 @@
+import numpy as np
+import collections
+import scipy.sparse
+from lazydiff.vars import Var, Partial, _jvp, _vjp, _errstate, _mask, _issparse, get_error_policy
+
+def _check_vars(vars):
+    """
+    Raises error unless vars is a list of Var objects
+    """
+    for var in vars:
+        if not isinstance(var, Var):
+            raise TypeError('Inputs needs to be Var object.')
+
+def _offsets(vars):
+    """
+    Returns array of the index of the first component of each variable in
+    vars when their components are numbered one after the other, followed
+    by the total number of components
+    """
+    return np.cumsum([0] + [np.size(var.val) for var in vars])
+
+def _graph(outputs):
+    """
+    Returns list of the variables the outputs depend on, ordered so that
+    every variable comes before its parents
+    """
+    top_sort = collections.deque()
+    seen = set()
+    for output in outputs:
+        if output not in seen:
+            output._backward_visit(output, top_sort, seen)
+    return list(top_sort)
+
+def _elementwise(child, parent, factor):
+    """
+    Returns True if component i of child only depends on component i of
+    parent through the partial derivative factor
+    """
+    shape = np.shape(child.val)
+    return (not isinstance(factor, Partial) and np.shape(parent.val) == shape
+            and np.shape(factor) in ((), shape))
+
+def _columns(deps):
+    """
+    Returns set of the input components found in deps, the dependencies of
+    a variable as stored by sparsity_pattern
+    """
+    return deps if isinstance(deps, set) else set(deps.indices.tolist())
+
+def _rows(columns, size, total):
+    """
+    Returns boolean scipy.sparse.csr_matrix with size rows of total columns,
+    each True at the columns in the set columns
+    """
+    columns = np.array(sorted(columns), dtype=np.int64)
+    return scipy.sparse.csr_matrix((np.ones(size * len(columns), dtype=bool), np.tile(columns, size),
+                                    np.arange(size + 1) * len(columns)), shape=(size, total))
+
+def sparsity_pattern(outputs, inputs):
+    """
+    Returns boolean scipy.sparse.csr_matrix whose entry (i, j) is True if
+    component i of the outputs depends on component j of the inputs through
+    the graph, where the components of the variables in outputs and inputs
+    are numbered one after the other. Elementwise operations keep the
+    components apart, while any other operation, such as a reduction, a
+    broadcast or a matrix product, is taken to make every component of its
+    result depend on every component of its arguments.
+    """
+    _check_vars(outputs)
+    _check_vars(inputs)
+    offsets = _offsets(inputs)
+    total = offsets[-1]
+    index = {var: j for j, var in enumerate(inputs)}
+    # dependencies are sets of input components for scalar variables and
+    # boolean sparse matrices with one row per component otherwise
+    deps = {}
+    for var in reversed(_graph(outputs)):
+        size = np.size(var.val)
+        if size == 1:
+            found = {offsets[index[var]]} if var in index else set()
+            for parent in var.parents.keys():
+                found |= _columns(deps[parent])
+        else:
+            found = scipy.sparse.csr_matrix((size, total), dtype=bool)
+            if var in index:
+                found = found + scipy.sparse.csr_matrix(
+                    (np.ones(size, dtype=bool), (np.arange(size), offsets[index[var]] + np.arange(size))),
+                    shape=(size, total))
+            for parent, factor in var.parents.items():
+                if _elementwise(var, parent, factor):
+                    found = found + deps[parent]
+                else:
+                    found = found + _rows(_columns(deps[parent]), size, total)
+        deps[var] = found
+    rows, cols = [], []
+    start = 0
+    for output in outputs:
+        if isinstance(deps[output], set):
+            cols.extend(deps[output])
+            rows.extend([start] * len(deps[output]))
+        else:
+            output_rows, output_cols = deps[output].nonzero()
+            rows.extend((output_rows + start).tolist())
+            cols.extend(output_cols.tolist())
+        start += np.size(output.val)
+    return scipy.sparse.csr_matrix((np.ones(len(rows), dtype=bool), (rows, cols)), shape=(start, total))
+
+def color_columns(pattern):
+    """
+    Returns array assigning a color to every column of the sparse boolean
+    matrix pattern, such that columns with a nonzero in the same row have
+    different colors. Uses the greedy algorithm in column order.
+    """
+    pattern = scipy.sparse.csr_matrix(pattern)
+    by_col = pattern.tocsc()
+    colors = np.full(pattern.shape[1], -1)
+    for j in range(pattern.shape[1]):
+        used = set()
+        for i in by_col.indices[by_col.indptr[j]:by_col.indptr[j + 1]]:
+            used.update(colors[pattern.indices[pattern.indptr[i]:pattern.indptr[i + 1]]])
+        color = 0
+        while color in used:
+            color += 1
+        colors[j] = color
+    return colors
+
+def _reduce(value, shape):
+    """
+    Returns tangent or cotangent value summed to shape, undoing the
+    broadcasting of partial derivatives and the input shape kept by those
+    of reductions, or broadcast to shape if it has fewer components
+    """
+    if getattr(value, 'shape', None) == shape:
+        return value
+    if _issparse(value):
+        value = value.toarray()
+    value = np.asarray(value)
+    if int(np.prod(shape)) == 1:
+        return np.sum(value).reshape(shape)
+    extra = value.ndim - len(shape)
+    if extra > 0:
+        value = np.sum(value, axis=tuple(range(extra)))
+    axes = tuple(i for i, n in enumerate(shape) if n == 1 and value.ndim == len(shape) and value.shape[i] != 1)
+    if axes:
+        value = np.sum(value, axis=axes, keepdims=True)
+    return np.broadcast_to(value, shape)
+
+def _forward_sweep(graph, seeds):
+    """
+    Returns dictionary of the derivatives of the variables in graph along the
+    direction given by dictionary seeds mapping variables to their tangents
+    """
+    tangents = dict(seeds)
+    mask = get_error_policy() == 'mask'
+    with _errstate():
+        for var in reversed(graph):
+            if var in tangents:
+                continue
+            shape = var.val.shape
+            contributions = [_reduce(_jvp(factor, tangents[parent]), shape)
+                             for parent, factor in var.parents.items() if parent in tangents]
+            if contributions:
+                tangents[var] = np.sum(contributions, axis=0)
+                if mask:
+                    tangents[var] = _mask(tangents[var])
+    return tangents
+
+def _reverse_sweep(graph, seeds):
+    """
+    Returns dictionary of the adjoints of the variables in graph for the
+    cotangents given by dictionary seeds mapping variables to their cotangents
+    """
+    adjoints = dict(seeds)
+    contributions = {}
+    mask = get_error_policy() == 'mask'
+    with _errstate():
+        for var in graph:
+            if var not in adjoints:
+                if var not in contributions:
+                    continue
+                adjoints[var] = np.sum(contributions.pop(var), axis=0)
+                if mask:
+                    adjoints[var] = _mask(adjoints[var])
+            # pushed along the edges stored on the children, which are the
+            # same inside and outside of a tape
+            for parent, factor in var.parents.items():
+                contributions.setdefault(parent, []).append(_reduce(_vjp(factor, adjoints[var]), parent.val.shape))
+    return adjoints
+
+def _seeds(vars, offsets, colors, color):
+    """
+    Returns dictionary mapping the variables in vars with components of
+    color color to arrays with ones at those components
+    """
+    seeds = {}
+    for j, var in enumerate(vars):
+        selected = colors[offsets[j]:offsets[j + 1]] == color
+        if np.any(selected):
+            seeds[var] = selected.reshape(np.shape(var.val)).astype(var.val.dtype)
+    return seeds
+
+def jacobian(outputs, inputs, mode=None):
+    """
+    Returns scipy.sparse.csr_matrix holding the Jacobian of the list of
+    variables outputs with respect to the list of variables inputs, with one
+    row per component of the outputs and one column per component of the
+    inputs, numbered one variable after the other.
+    The sparsity pattern is read from the graph and colored so that input
+    components (mode 'forward') or output components (mode 'reverse') that
+    never meet share one sweep. If mode is None, the mode needing fewer
+    sweeps is used.
+    """
+    pattern = sparsity_pattern(outputs, inputs)
+    graph = _graph(outputs)
+    column_colors = color_columns(pattern)
+    row_colors = color_columns(pattern.T)
+    if mode is None:
+        mode = 'forward' if column_colors.max(initial=-1) <= row_colors.max(initial=-1) else 'reverse'
+    output_offsets = _offsets(outputs)
+    input_offsets = _offsets(inputs)
+    rows, cols = pattern.nonzero()
+    row_vars = np.searchsorted(output_offsets, rows, side='right') - 1
+    col_vars = np.searchsorted(input_offsets, cols, side='right') - 1
+    data = np.zeros(len(rows))
+    if mode == 'forward':
+        for color in range(column_colors.max(initial=-1) + 1):
+            tangents = _forward_sweep(graph, _seeds(inputs, input_offsets, column_colors, color))
+            for k in np.flatnonzero(column_colors[cols] == color):
+                output = outputs[row_vars[k]]
+                data[k] = _reduce(tangents[output], np.shape(output.val)).flat[rows[k] - output_offsets[row_vars[k]]]
+    elif mode == 'reverse':
+        for color in range(row_colors.max(initial=-1) + 1):
+            adjoints = _reverse_sweep(graph, _seeds(outputs, output_offsets, row_colors, color))
+            for k in np.flatnonzero(row_colors[rows] == color):
+                var = inputs[col_vars[k]]
+                data[k] = _reduce(adjoints[var], np.shape(var.val)).flat[cols[k] - input_offsets[col_vars[k]]]
+    else:
+        raise ValueError("Mode needs to be 'forward', 'reverse' or None.")
+    return scipy.sparse.csr_matrix((data, (rows, cols)), shape=pattern.shape)
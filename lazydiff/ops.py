@@ -1,6 +1,9 @@
 import numpy as np
-from lazydiff.vars import Var
+import functools
+import itertools
+from lazydiff.vars import Var, Partial, _issparse, _resolve_dtype, _operation
 
+@_operation
 def sin(var):
     """
     Returns variable representing sin applied to the input variable var
@@ -9,6 +12,7 @@ def sin(var):
     result.parents[var] = var.children[result] = np.cos(var.val)
     return result
 
+@_operation
 def cos(var):
     """
     Returns variable representing cos applied to the input variable var
@@ -17,6 +21,7 @@ def cos(var):
     result.parents[var] = var.children[result] = -np.sin(var.val)
     return result
 
+@_operation
 def tan(var):
     """
     Returns variable representing tan applied to the input variable var
@@ -25,6 +30,7 @@ def tan(var):
     result.parents[var] = var.children[result] = 1 / np.cos(var.val) ** 2
     return result
 
+@_operation
 def asin(var):
     """
     Returns variable representing asin applied to the input variable var
@@ -33,6 +39,7 @@ def asin(var):
     result.parents[var] = var.children[result] = 1 / np.sqrt(1 - var.val ** 2)
     return result
 
+@_operation
 def acos(var):
     """
     Returns variable representing acos applied to the input variable var
@@ -41,6 +48,7 @@ def acos(var):
     result.parents[var] = var.children[result] = -1 / np.sqrt(1 - var.val ** 2)
     return result
 
+@_operation
 def atan(var):
     """
     Returns variable representing atan applied to the input variable var
@@ -67,6 +75,7 @@ def arctan(var):
     """
     return atan(var)
 
+@_operation
 def sinh(var):
     """
     Returns variable representing sinh applied to the input variable var
@@ -75,6 +84,7 @@ def sinh(var):
     result.parents[var] = var.children[result] = np.cosh(var.val)
     return result
 
+@_operation
 def cosh(var):
     """
     Returns variable representing cosh applied to the input variable var
@@ -83,6 +93,7 @@ def cosh(var):
     result.parents[var] = var.children[result] = np.sinh(var.val)
     return result
 
+@_operation
 def tanh(var):
     """
     Returns variable representing tanh applied to the input variable var
@@ -91,6 +102,7 @@ def tanh(var):
     result.parents[var] = var.children[result] = 1 / (np.cosh(var.val) ** 2)
     return result
 
+@_operation
 def asinh(var):
     """
     Returns variable representing asinh applied to the input variable var
@@ -99,6 +111,7 @@ def asinh(var):
     result.parents[var] = var.children[result] = 1 / np.sqrt(var.val ** 2 + 1)
     return result
 
+@_operation
 def acosh(var):
     """
     Returns variable representing acosh applied to the input variable var
@@ -107,6 +120,7 @@ def acosh(var):
     result.parents[var] = var.children[result] = 1 / np.sqrt(var.val ** 2 - 1)
     return result
 
+@_operation
 def atanh(var):
     """
     Returns variable representing atanh applied to the input variable var
@@ -133,6 +147,7 @@ def arctanh(var):
     """
     return atanh(var)
 
+@_operation
 def exp(var):
     """
     Returns variable representing exp applied to the input variable var
@@ -141,6 +156,7 @@ def exp(var):
     result.parents[var] = var.children[result] = np.exp(var.val)
     return result
 
+@_operation
 def log(var, base=np.e):
     """
     Returns variable representing log applied to the input variable var.
@@ -150,31 +166,484 @@ def log(var, base=np.e):
     result.parents[var] = var.children[result] = 1 / (var.val * np.log(base))
     return result
 
+def _logistic(val):
+    """
+    Returns sigmoid of numpy array val. Overflow and underflow of exp only
+    happen where the sigmoid rounds to 0 or 1, which is then the result.
+    """
+    with np.errstate(over='ignore', under='ignore'):
+        return 1 / (1 + np.exp(-val))
+
+@_operation
 def logistic(var):
     """
     Returns variable representing sigmoid applied to input variable var
     """
-    return (1 + exp(-var)) ** -1
+    val = _logistic(var.val)
+    result = Var(val)
+    result.parents[var] = var.children[result] = val * (1 - val)
+    return result
 
+@_operation
+def softplus(var):
+    """
+    Returns variable representing softplus log(1 + exp(var)) applied to
+    input variable var
+    """
+    with np.errstate(under='ignore'):
+        val = np.maximum(var.val, 0) + np.log1p(np.exp(-np.abs(var.val)))
+    result = Var(val)
+    result.parents[var] = var.children[result] = _logistic(var.val)
+    return result
+
+@_operation
 def sqrt(var):
     """
     Returns variable representing square root applied to input variable var
     """
-    return var ** 0.5
+    val = np.sqrt(var.val)
+    result = Var(val)
+    result.parents[var] = var.children[result] = 0.5 / val
+    return result
 
+@_operation
 def sum(var):
     """
     Returns variable representing the sum of the components of input variable var
     """
+    if _issparse(var.val):
+        ones = var.val.copy()
+        ones.data[:] = 1.
+        result = Var(var.val.sum())
+        result.parents[var] = var.children[result] = ones
+        return result
     result = Var(np.sum(var.val))
     result.parents[var] = var.children[result] = np.ones_like(var.val)
     return result    
 
+@_operation
+def logsumexp(var):
+    """
+    Returns variable representing log of the sum of the exponentials of the
+    components of input variable var, computed without overflow
+    """
+    shift = np.max(var.val)
+    with np.errstate(under='ignore'):
+        exps = np.exp(var.val - shift)
+    total = np.sum(exps)
+    result = Var(shift + np.log(total))
+    result.parents[var] = var.children[result] = exps / total
+    return result
+
+@_operation
 def norm(var, p=1):
     """
     Returns variable representing L-p norm of input variable var
     """
-    return sum(abs(var) ** p) ** (1 / p)
+    val = np.sum(np.abs(var.val) ** p) ** (1 / p)
+    result = Var(val)
+    result.parents[var] = var.children[result] = np.sign(var.val) * (np.abs(var.val) / val) ** (p - 1)
+    return result
+
+@_operation
+def squared_error(var1, var2):
+    """
+    Returns variable representing the sum of the squared differences between
+    the components of input variable var1 and variable or constant var2
+    """
+    diff = var1.val - (var2.val if isinstance(var2, Var) else var2)
+    result = Var(np.sum(diff ** 2))
+    result.parents[var1] = var1.children[result] = 2 * diff
+    if isinstance(var2, Var):
+        result.parents[var2] = var2.children[result] = -2 * diff
+    return result
+
+@_operation
+def binary_cross_entropy(var, y):
+    """
+    Returns variable representing the sum of the negative log likelihoods of
+    the binary labels y under the probabilities sigmoid(var), where input
+    variable var holds logits, computed without overflow
+    """
+    y = np.asarray(y, dtype=var.val.dtype)
+    with np.errstate(under='ignore'):
+        val = np.sum(np.maximum(var.val, 0) + np.log1p(np.exp(-np.abs(var.val))) - y * var.val)
+    result = Var(val)
+    result.parents[var] = var.children[result] = _logistic(var.val) - y
+    return result
+
+@_operation
+def poisson_nll(var, y):
+    """
+    Returns variable representing the sum of the negative log likelihoods of
+    the counts y under Poisson distributions with means exp(var), up to the
+    terms not depending on var
+    """
+    y = np.asarray(y, dtype=var.val.dtype)
+    rates = np.exp(var.val)
+    result = Var(np.sum(rates - y * var.val))
+    result.parents[var] = var.children[result] = rates - y
+    return result
+
+@_operation
+def softmax_cross_entropy(var, y):
+    """
+    Returns variable representing the sum over the rows of input variable
+    var, which hold logits of classes, of the negative log likelihoods of
+    the labels y under the softmax of the rows, computed without overflow.
+    y is either a vector of class indices or an array of class probabilities
+    with the shape of var.
+    """
+    shift = np.max(var.val, axis=-1, keepdims=True)
+    with np.errstate(under='ignore'):
+        exps = np.exp(var.val - shift)
+    totals = np.sum(exps, axis=-1, keepdims=True)
+    log_probs = var.val - shift - np.log(totals)
+    if np.ndim(y) == var.val.ndim:
+        targets = np.asarray(y, dtype=var.val.dtype)
+    else:
+        targets = np.zeros_like(var.val)
+        np.put_along_axis(targets, np.asarray(y, dtype=int)[..., None], 1., axis=-1)
+    result = Var(-np.sum(targets * log_probs))
+    result.parents[var] = var.children[result] = exps / totals * np.sum(targets, axis=-1, keepdims=True) - targets
+    return result
+
+class _MatmulPartial(Partial):
+    """
+    Partial derivative of the matrix product of two operands with respect to
+    one of them, given the values of both operands and whether the
+    differentiated operand is the left one
+    """
+
+    def __init__(self, operand, other, left):
+        """
+        Initializes partial derivative with respect to operand
+        """
+        self.operand = operand
+        self.other = other
+        self.left = left
+
+    def jvp(self, tangent):
+        """
+        Returns the product with tangent in place of the operand. Needs a
+        tangent with the shape of the operand, since the product mixes its
+        components, or a batch of such tangents along leading axes.
+        """
+        shape = self.operand.shape
+        if np.ndim(tangent) < len(shape) or np.shape(tangent)[np.ndim(tangent) - len(shape):] != shape:
+            raise ValueError('Forward mode through matmul needs a tangent with the shape of the operand. Use backward instead.')
+        if self.left:
+            return tangent @ self.other
+        if np.ndim(tangent) > len(shape) == 1:
+            return (self.other @ tangent.T).T
+        return self.other @ tangent
+
+    def vjp(self, cotangent):
+        """
+        Returns the product of cotangent with the transpose of the other
+        operand. For a sparse operand, only the entries of its sparsity
+        pattern are computed.
+        """
+        left, right = (self.operand, self.other) if self.left else (self.other, self.operand)
+        if _issparse(cotangent):
+            cotangent = cotangent.toarray()
+        cotangent = np.broadcast_to(cotangent, left.shape[:-1] + right.shape[1:])
+        left = left if left.ndim == 2 else left.reshape(1, -1)
+        right = right if right.ndim == 2 else right.reshape(-1, 1)
+        cotangent = cotangent.reshape(left.shape[0], right.shape[1])
+        if _issparse(self.operand):
+            import scipy.sparse
+            rows, cols = self.operand.nonzero()
+            if self.left:
+                right = right.toarray() if _issparse(right) else right
+                data = np.einsum('ij,ij->i', cotangent[rows], right[cols])
+            else:
+                left = left.toarray() if _issparse(left) else left
+                data = np.einsum('ij,ij->j', left[:, rows], cotangent[:, cols])
+            return scipy.sparse.csr_matrix((data, (rows, cols)), shape=self.operand.shape)
+        if self.left:
+            return (right @ cotangent.T).T.reshape(self.operand.shape)
+        return (left.T @ cotangent).reshape(self.operand.shape)
+
+def _operand(var):
+    """
+    Returns the value of variable or constant var as a numpy array or sparse matrix
+    """
+    if isinstance(var, Var):
+        return var.val
+    if _issparse(var):
+        return var
+    return np.asarray(var, dtype=_resolve_dtype(var))
+
+@_operation
+def matmul(var1, var2):
+    """
+    Returns variable representing the matrix product of var1 and var2, each
+    of which is a variable or a constant numpy array or scipy.sparse matrix.
+    Derivatives with respect to the variables are only computed in backward,
+    since the product mixes the components of its operands.
+    """
+    val1 = _operand(var1)
+    val2 = _operand(var2)
+    result = Var(val1 @ val2)
+    if isinstance(var1, Var):
+        result.parents[var1] = var1.children[result] = _MatmulPartial(val1, val2, True)
+    if isinstance(var2, Var):
+        result.parents[var2] = var2.children[result] = _MatmulPartial(val2, val1, False)
+    return result
+
+def polynomial_terms(features, degree, interaction_only=False):
+    """
+    Returns list of tuples of the indices of the features multiplied in each
+    term of the polynomial expansion of degree degree of features features,
+    without the constant term and in the order of
+    sklearn.preprocessing.PolynomialFeatures. If interaction_only is True,
+    only products of distinct features are included.
+    """
+    combinations = itertools.combinations if interaction_only else itertools.combinations_with_replacement
+    return [term for d in range(1, degree + 1) for term in combinations(range(features), d)]
+
+def _expand(X, indices):
+    """
+    Returns the polynomial features of the rows of dense or sparse matrix X
+    for the terms given as rows of array indices, padded with the index one
+    past the last feature, which stands for a feature equal to one
+    """
+    if _issparse(X):
+        X = X.toarray()
+    X = np.concatenate([X, np.ones((X.shape[0], 1), dtype=X.dtype)], axis=1)
+    features = X[:, indices[:, 0]]
+    for column in indices.T[1:]:
+        features *= X[:, column]
+    return features
+
+class _PolynomialPartial(Partial):
+    """
+    Partial derivative of the product of the polynomial features of X with a
+    variable of shape shape with respect to the variable. The features are
+    expanded chunk_size rows at a time whenever they are needed and never
+    stored.
+    """
+
+    def __init__(self, X, degree, interaction_only, chunk_size, shape):
+        """
+        Initializes partial derivative for the terms of polynomial_terms
+        """
+        terms = polynomial_terms(X.shape[1], degree, interaction_only)
+        if shape[:1] != (len(terms),):
+            raise ValueError('Variable needs one row per polynomial term, {} here.'.format(len(terms)))
+        self.X = X
+        self.indices = np.array([term + (X.shape[1],) * (degree - len(term)) for term in terms],
+                                dtype=int).reshape(len(terms), degree)
+        self.chunk_size = chunk_size
+        self.shape = shape
+
+    def _chunks(self):
+        """
+        Yields the bounds of each chunk of rows with its polynomial features
+        """
+        rows = self.X.shape[0]
+        for start in range(0, rows, self.chunk_size):
+            stop = min(start + self.chunk_size, rows)
+            yield start, stop, _expand(self.X[start:stop], self.indices)
+
+    def jvp(self, tangent):
+        """
+        Returns the product of the features with tangent, which has the shape
+        of the variable or is a batch of such tangents along leading axes
+        """
+        if np.ndim(tangent) < len(self.shape) or np.shape(tangent)[np.ndim(tangent) - len(self.shape):] != self.shape:
+            raise ValueError('Forward mode through polynomial_matmul needs a tangent with the shape of the variable.')
+        batch = np.shape(tangent)[:np.ndim(tangent) - len(self.shape)]
+        tangent = np.reshape(tangent, (-1,) + self.shape)
+        products = [np.einsum('rt,kt...->kr...', features, tangent) for _, _, features in self._chunks()]
+        return np.concatenate(products, axis=1).reshape(batch + (self.X.shape[0],) + self.shape[1:])
+
+    def vjp(self, cotangent):
+        """
+        Returns the product of the transposed features with cotangent
+        """
+        if _issparse(cotangent):
+            cotangent = cotangent.toarray()
+        cotangent = np.broadcast_to(cotangent, (self.X.shape[0],) + self.shape[1:])
+        grad = 0
+        for start, stop, features in self._chunks():
+            grad = grad + np.tensordot(features, cotangent[start:stop], axes=(0, 0))
+        return grad
+
+@_operation
+def polynomial_matmul(X, var, degree=2, interaction_only=False, chunk_size=1024):
+    """
+    Returns variable representing the matrix product of the polynomial
+    features of the rows of the constant dense or sparse matrix X, as given
+    by polynomial_terms, with variable var, which has one row per term.
+    The features are computed chunk_size rows at a time, in the product and
+    in its derivatives, so the expanded matrix is never stored.
+    """
+    partial = _PolynomialPartial(_operand(X), degree, interaction_only, chunk_size, var.val.shape)
+    result = Var(partial.jvp(var.val))
+    result.parents[var] = var.children[result] = partial
+    return result
+
+class _BroadcastPartial(Partial):
+    """
+    Partial derivative of the broadcast of a variable with shape shape to shape
+    result_shape with respect to the variable
+    """
+
+    def __init__(self, shape, result_shape):
+        """
+        Initializes partial derivative for the given shapes
+        """
+        self.shape = shape
+        self.result_shape = result_shape
+
+    def jvp(self, tangent):
+        """
+        Returns tangent broadcast to the shape of the result, keeping the
+        leading axes of a batch of tangents
+        """
+        batch = np.shape(tangent)[:max(np.ndim(tangent) - len(self.shape), 0)]
+        tangent = np.reshape(tangent, batch + (1,) * (len(self.result_shape) - len(self.shape)) + np.shape(tangent)[len(batch):])
+        return np.broadcast_to(tangent, batch + self.result_shape)
+
+    def vjp(self, cotangent):
+        """
+        Returns cotangent summed over the broadcast axes
+        """
+        cotangent = np.broadcast_to(cotangent, self.result_shape)
+        extra = len(self.result_shape) - len(self.shape)
+        cotangent = np.sum(cotangent, axis=tuple(range(extra)))
+        axes = tuple(i for i, dim in enumerate(self.shape) if dim == 1 and cotangent.shape[i] != 1)
+        return np.sum(cotangent, axis=axes, keepdims=True).reshape(self.shape)
+
+@_operation
+def broadcast_to(var, shape):
+    """
+    Returns variable representing input variable var broadcast to shape, whose
+    gradient in backward is summed back to the shape of var
+    """
+    result = Var(np.broadcast_to(var.val, shape))
+    result.parents[var] = var.children[result] = _BroadcastPartial(var.val.shape, tuple(shape))
+    return result
+
+class _CustomCall:
+    """
+    Rules, argument values and result of one call of a custom_op, shared by
+    the partial derivatives of the result with respect to each argument.
+    Keeps the cotangents of the last vjp, so a rule computing the
+    cotangents of all arguments together runs once per backward.
+    """
+
+    def __init__(self, name, jvp, vjp, values, kwargs):
+        """
+        Initializes call of the operation name on argument values
+        """
+        self.name = name
+        self.jvp = jvp
+        self.vjp = vjp
+        self.values = values
+        self.kwargs = kwargs
+        self.result = None
+        self.cotangent = None
+        self.cotangents = None
+
+    def apply_vjp(self, cotangent):
+        """
+        Returns tuple of the cotangents of all arguments for cotangent
+        """
+        if self.vjp is None:
+            raise ValueError('Reverse mode through {} needs a vjp rule. Use forward instead.'.format(self.name))
+        if cotangent is not self.cotangent:
+            self.cotangent = cotangent
+            if _issparse(cotangent):
+                cotangent = cotangent.toarray()
+            cotangent = np.broadcast_to(cotangent, np.shape(self.result))
+            self.cotangents = tuple(self.vjp(cotangent, self.result, *self.values, **self.kwargs))
+        return self.cotangents
+
+class _CustomPartial(Partial):
+    """
+    Partial derivative of the result of a custom_op with respect to a
+    variable passed as the arguments at positions indices
+    """
+
+    def __init__(self, call, indices):
+        """
+        Initializes partial derivative for the given call
+        """
+        self.call = call
+        self.indices = indices
+
+    def _apply_jvp(self, tangent):
+        """
+        Returns the derivative of the result for a single tangent with the
+        shape of the variable
+        """
+        tangents = tuple(tangent if i in self.indices else None for i in range(len(self.call.values)))
+        return np.asarray(self.call.jvp(tangents, self.call.result, *self.call.values, **self.call.kwargs))
+
+    def jvp(self, tangent):
+        """
+        Returns the derivative of the result along tangent, applying the jvp
+        rule to each tangent of a batch along leading axes in turn
+        """
+        if self.call.jvp is None:
+            raise ValueError('Forward mode through {} needs a jvp rule. Use backward instead.'.format(self.call.name))
+        shape = np.shape(self.call.values[self.indices[0]])
+        if np.ndim(tangent) <= len(shape):
+            return self._apply_jvp(np.broadcast_to(tangent, shape))
+        batch = np.shape(tangent)[:np.ndim(tangent) - len(shape)]
+        derivatives = [self._apply_jvp(single) for single in np.reshape(tangent, (-1,) + shape)]
+        return np.reshape(derivatives, batch + np.shape(self.call.result))
+
+    def vjp(self, cotangent):
+        """
+        Returns the sum of the cotangents given by the vjp rule for the
+        positions of the variable
+        """
+        cotangents = self.call.apply_vjp(cotangent)
+        value = np.asarray(self.call.values[self.indices[0]])
+        grad = np.zeros(value.shape, dtype=value.dtype)
+        for i in self.indices:
+            if cotangents[i] is not None:
+                grad = grad + cotangents[i]
+        return grad
+
+def custom_op(function=None, jvp=None, vjp=None):
+    """
+    Decorator turning function, which computes a numpy array from its
+    arguments, into an operation whose result is a single variable, with
+    derivatives given by the rules jvp and vjp instead of being traced.
+    Variables can be passed for any positional arguments; function and the
+    rules receive their values. Keyword arguments are passed unchanged.
+    jvp(tangents, result, *args, **kwargs) returns the derivative of the
+    result along tangents, a tuple with the tangent of each positional
+    argument, or None for the arguments held fixed.
+    vjp(cotangent, result, *args, **kwargs) returns a tuple with the product
+    of cotangent with the derivative of the result with respect to each
+    positional argument, or None for arguments without one.
+    Either rule can be left out, which leaves the matching mode unsupported.
+    Used as @custom_op(jvp=..., vjp=...).
+    """
+    if function is None:
+        return lambda function: custom_op(function, jvp, vjp)
+
+    @_operation
+    @functools.wraps(function)
+    def operation(*args, **kwargs):
+        values = tuple(arg.val if isinstance(arg, Var) else arg for arg in args)
+        call = _CustomCall(function.__name__, jvp, vjp, values, kwargs)
+        result = Var(function(*values, **kwargs))
+        call.result = result.val
+        positions = {}
+        for i, arg in enumerate(args):
+            if isinstance(arg, Var):
+                positions.setdefault(arg, []).append(i)
+        for var, indices in positions.items():
+            result.parents[var] = var.children[result] = _CustomPartial(call, indices)
+        return result
+    return operation
 
 def neg(var):
     """
@@ -0,0 +1,151 @@
+import numpy as np
+from lazydiff.vars import Partial, _graph_changed
+
+def _ancestors(var):
+    """
+    Returns list of the variables var depends on, including var itself,
+    ordered so that every variable comes before its parents
+    """
+    top_sort = []
+    seen = {var}
+    stack = [(var, False)]
+    while stack:
+        node, done = stack.pop()
+        if done:
+            top_sort.append(node)
+            continue
+        stack.append((node, True))
+        for parent in node.parents.keys():
+            if parent not in seen:
+                seen.add(parent)
+                stack.append((parent, False))
+    top_sort.reverse()
+    return top_sort
+
+def count_nodes(var):
+    """
+    Returns the number of variables in the graph of var, including var itself
+    """
+    return len(_ancestors(var))
+
+def fuse(var):
+    """
+    Fuses chains of operations in the graph of var. Every intermediate
+    variable with a single parent and a single child is removed, and the
+    product of its two partial derivatives becomes the partial derivative
+    of the child with respect to the parent.
+    Derivatives of var with respect to the remaining variables are unchanged,
+    but removed variables are detached from the graph, and the variables whose
+    parents changed can no longer be recomputed by Var.set_value.
+    Returns the number of removed variables.
+    """
+    removed = 0
+    for node in _ancestors(var):
+        if node is var or len(node.parents) != 1 or len(node.children) != 1:
+            continue
+        (parent, factor1), = node.parents.items()
+        (child, factor2), = node.children.items()
+        existing = child.parents.get(parent, 0.)
+        if isinstance(factor1, Partial) or isinstance(factor2, Partial) or isinstance(existing, Partial):
+            continue
+        del child.parents[node]
+        del parent.children[node]
+        child.parents[parent] = parent.children[child] = existing + factor1 * factor2
+        child._op = None
+        node.parents.clear()
+        node.children.clear()
+        removed += 1
+    _graph_changed()
+    return removed
+
+def _array_key(val):
+    """
+    Returns hashable key identifying the dtype, shape and contents of val
+    """
+    val = np.asarray(val)
+    return (val.dtype.str, val.shape, val.tobytes())
+
+def _node_key(node):
+    """
+    Returns hashable key identifying a variable by its value and its partial
+    derivatives with respect to each of its parents, or None if the variable
+    cannot be compared
+    """
+    edges = []
+    for parent, factor in node.parents.items():
+        if isinstance(factor, Partial):
+            return None
+        edges.append((id(parent), _array_key(factor)))
+    return (tuple(sorted(edges)), _array_key(node.val))
+
+def eliminate_common_subexpressions(var):
+    """
+    Merges variables in the graph of var that have the same value and the
+    same partial derivatives with respect to the same parents, since they
+    represent the same operation applied to the same inputs.
+    Derivatives of var with respect to the remaining variables are unchanged,
+    but the variables whose parents changed can no longer be recomputed by
+    Var.set_value.
+    Returns the number of removed variables.
+    """
+    removed = 0
+    seen = {}
+    for node in reversed(_ancestors(var)):
+        if node is var or not node.parents:
+            continue
+        key = _node_key(node)
+        if key is None:
+            continue
+        if key not in seen:
+            seen[key] = node
+            continue
+        same = seen[key]
+        if any(isinstance(factor, Partial) or isinstance(child.parents.get(same, 0.), Partial)
+               for child, factor in node.children.items()):
+            continue
+        for parent in node.parents.keys():
+            del parent.children[node]
+        for child, factor in node.children.items():
+            del child.parents[node]
+            child.parents[same] = same.children[child] = child.parents.get(same, 0.) + factor
+            child._op = None
+        node.parents.clear()
+        node.children.clear()
+        removed += 1
+    _graph_changed()
+    return removed
+
+def fold_constants(var, wrt):
+    """
+    Detaches the parts of the graph of var that do not depend on any of the
+    variables in wrt. Their values are already part of the values and partial
+    derivatives of the variables using them, so derivatives of var with
+    respect to wrt are unchanged.
+    Returns the number of removed variables.
+    """
+    ancestors = _ancestors(var)
+    active = set(wrt)
+    for node in reversed(ancestors):
+        if any(parent in active for parent in node.parents.keys()):
+            active.add(node)
+    for node in active:
+        for parent in list(node.parents.keys()):
+            if parent not in active:
+                del node.parents[parent]
+                del parent.children[node]
+    _graph_changed()
+    return len(ancestors) - count_nodes(var)
+
+def simplify(var, wrt=None):
+    """
+    Runs constant folding with respect to the variables wrt, if given,
+    common subexpression elimination and fusion on the graph of var.
+    Returns dictionary reporting the number of variables before and after
+    and the number removed by each pass.
+    """
+    report = {'before': count_nodes(var)}
+    report['folded'] = fold_constants(var, wrt) if wrt is not None else 0
+    report['deduplicated'] = eliminate_common_subexpressions(var)
+    report['fused'] = fuse(var)
+    report['after'] = count_nodes(var)
+    return report
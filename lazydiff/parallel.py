@@ -0,0 +1,310 @@
+import numpy as np
+import functools
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+from lazydiff.vars import Var, _vjp, _errstate, _mask, get_error_policy
+from lazydiff import regression
+
+_shared = {}
+
+def _share(array):
+    """
+    Copies numpy array into a new block of shared memory.
+    Returns the shared memory block and the description needed to attach to it.
+    """
+    array = np.ascontiguousarray(array)
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    return block, (block.name, array.shape, array.dtype.str)
+
+def _attach(description):
+    """
+    Returns shared memory block and numpy array backed by it from the
+    description returned by _share
+    """
+    name, shape, dtype = description
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+def _init_worker(X_description, y_description):
+    """
+    Attaches worker process to the shared training data
+    """
+    _shared['X_block'], _shared['X'] = _attach(X_description)
+    _shared['y_block'], _shared['y'] = _attach(y_description)
+
+def _shard_gradient(task):
+    """
+    Computes loss and gradients with respect to m and b on the rows start:stop
+    of the shared training data
+    """
+    loss_function, start, stop, m_val, b_val = task
+    m = Var(m_val)
+    b = Var(b_val)
+    loss = loss_function(_shared['X'][start:stop], _shared['y'][start:stop], m, b)
+    loss.backward()
+    return loss.val, loss.grad(m), loss.grad(b)
+
+def _fit_fold(task):
+    """
+    Fits loss_function on the shared training data without the rows
+    start:stop and scores the fit on those rows with score_function.
+    Returns the final training loss, the score, the fitted m and b and the
+    time taken by the fit in seconds.
+    """
+    loss_function, score_function, start, stop, m_val, b_val, options = task
+    X, y = _shared['X'], _shared['y']
+    train_X = np.concatenate([X[:start], X[stop:]])
+    train_y = np.concatenate([y[:start], y[stop:]])
+    started = time.perf_counter()
+    m, b, loss = regression.iterative_regression(train_X, train_y, Var(m_val), Var(b_val), loss_function,
+                                                 **options)
+    elapsed = time.perf_counter() - started
+    score = score_function(X[start:stop], y[start:stop], m, b)
+    return loss.val, score.val, m.val, b.val, elapsed
+
+def _check_reduce(loss_function, reduce):
+    """
+    Raises error if the losses of loss_function on shards of the data cannot
+    be combined exactly as given by reduce
+    """
+    if reduce not in ('mean', 'sum'):
+        raise ValueError("Reduce needs to be 'mean' or 'sum'.")
+    while isinstance(loss_function, functools.partial):
+        loss_function = loss_function.func
+    if loss_function is regression.ridge_loss:
+        raise ValueError('ridge_loss sums over the rows and adds a penalty, so it cannot be combined over shards.')
+
+class _SharedPool:
+    """
+    Pool of processes workers attached to the training data X, y, which is
+    placed in shared memory once
+    """
+
+    def __init__(self, X, y, processes=None):
+        """
+        Initializes pool of processes workers, by default one per processor,
+        sharing X and y
+        """
+        self.processes = processes or multiprocessing.cpu_count()
+        self.shape = np.shape(X)
+        self.X_block, X_description = _share(X)
+        self.y_block, y_description = _share(y)
+        self.pool = multiprocessing.Pool(self.processes, _init_worker, (X_description, y_description))
+
+    def close(self):
+        """
+        Shuts down the pool and releases the shared memory
+        """
+        self.pool.terminate()
+        self.pool.join()
+        for block in (self.X_block, self.y_block):
+            block.close()
+            block.unlink()
+
+    def __enter__(self):
+        """
+        Returns self for use as a context manager
+        """
+        return self
+
+    def __exit__(self, *args):
+        """
+        Closes the pool when leaving the context
+        """
+        self.close()
+
+class DataParallel(_SharedPool):
+    """
+    Evaluates regression losses and their gradients over shards of the
+    training data X, y in a pool of processes. The training data is placed in
+    shared memory once, so only the parameters and gradients are sent between
+    processes at each step.
+    With reduce='mean', losses are combined by averaging the losses of the
+    shards weighted by their number of rows, which is exact for losses that
+    average over the rows, possibly plus a penalty on m and b, like the
+    losses in regression. With reduce='sum', the losses of the shards are
+    added, which is exact for losses summing over the rows without a
+    penalty. regression.ridge_loss sums over the rows and adds a penalty,
+    so neither is exact and it is rejected.
+    """
+
+    def __init__(self, X, y, processes=None, shards=None):
+        """
+        Initializes pool of processes workers sharing X and y, which are split
+        into shards parts, by default one per process
+        """
+        super().__init__(X, y, processes)
+        bounds = np.linspace(0, len(y), (shards or self.processes) + 1).astype(int)
+        self.shards = [(start, stop) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+    def gradient(self, loss_function, m, b, reduce='mean'):
+        """
+        Returns loss_function evaluated at parameters m, b on the shared data
+        together with its gradients with respect to m and b, combining the
+        shards as given by reduce
+        """
+        _check_reduce(loss_function, reduce)
+        tasks = [(loss_function, start, stop, m.val, b.val) for start, stop in self.shards]
+        results = self.pool.map(_shard_gradient, tasks)
+        loss, grad_m, grad_b = 0., 0., 0.
+        for (start, stop), (shard_loss, shard_grad_m, shard_grad_b) in zip(self.shards, results):
+            weight = (stop - start) / self.shape[0] if reduce == 'mean' else 1.
+            loss = loss + weight * shard_loss
+            grad_m = grad_m + weight * shard_grad_m
+            grad_b = grad_b + weight * shard_grad_b
+        return loss, grad_m, grad_b
+
+    def wrap(self, loss_function, reduce='mean'):
+        """
+        Returns loss function with the signature used in regression that
+        evaluates loss_function in parallel on the shared data, combining
+        the shards as given by reduce.
+        The returned variable depends directly on m and b, with the reduced
+        gradients as partial derivatives, so it can be used with both forward
+        and reverse mode, e.g. in regression.iterative_regression.
+        The X and y it is called with must be the data the pool was created with.
+        """
+        _check_reduce(loss_function, reduce)
+        def parallel_loss(X, y, m, b):
+            if np.shape(X) != self.shape:
+                raise ValueError('Data does not match the data shared with the pool.')
+            loss, grad_m, grad_b = self.gradient(loss_function, m, b, reduce)
+            result = Var(loss)
+            result.parents[m] = m.children[result] = grad_m
+            result.parents[b] = b.children[result] = grad_b
+            return result
+        return parallel_loss
+
+class CrossValidation(_SharedPool):
+    """
+    Evaluates regression losses by k-fold cross-validation on the training
+    data X, y, fitting the folds in a pool of processes. The training data is
+    placed in shared memory once and the pool is kept between calls, so a
+    search over many losses, e.g. over regularization weights, only sends
+    the loss functions and the starting parameters to the workers.
+    Loss and score functions need to be picklable, e.g. functions defined
+    at module level or functools.partial objects wrapping them.
+    """
+
+    def __init__(self, X, y, folds=5, processes=None, seed=None):
+        """
+        Initializes pool of processes workers sharing X and y, which are split
+        into folds consecutive parts, after shuffling the rows if seed is
+        not None
+        """
+        if folds < 2 or folds > len(y):
+            raise ValueError('Number of folds needs to be between 2 and the number of rows.')
+        if seed is not None:
+            order = np.random.default_rng(seed).permutation(len(y))
+            X = np.asarray(X)[order]
+            y = np.asarray(y)[order]
+        super().__init__(X, y, processes)
+        bounds = np.linspace(0, len(y), folds + 1).astype(int)
+        self.folds = list(zip(bounds[:-1], bounds[1:]))
+
+    def search(self, loss_functions, m, b, score_function=None, lr=0.1, epochs=100, earlyStop=0,
+               forward=None, step='fixed'):
+        """
+        Returns list with the result of evaluate for every loss function in
+        loss_functions, fitting the folds of all of them in the pool at once
+        """
+        options = {'lr': lr, 'epochs': epochs, 'earlyStop': earlyStop, 'forward': forward, 'step': step}
+        tasks = [(loss_function, score_function or loss_function, start, stop, m.val, b.val, options)
+                 for loss_function in loss_functions for start, stop in self.folds]
+        results = self.pool.map(_fit_fold, tasks, chunksize=1)
+        searched = []
+        for i in range(len(loss_functions)):
+            loss, score, m_vals, b_vals, times = zip(*results[i * len(self.folds):(i + 1) * len(self.folds)])
+            searched.append({'loss': np.array(loss), 'score': np.array(score), 'm': np.array(m_vals),
+                             'b': np.array(b_vals), 'time': np.array(times)})
+        return searched
+
+    def evaluate(self, loss_function, m, b, **kwargs):
+        """
+        Returns dictionary with arrays holding, for every fold, the training
+        loss after fitting loss_function on the other folds with
+        regression.iterative_regression starting from m, b, the score of the
+        fit on the fold, by default loss_function, the fitted coefficients m
+        and intercepts b and the time taken by the fit in seconds.
+        The keyword arguments score_function, lr, epochs, earlyStop, forward
+        and step are passed to search.
+        """
+        return self.search([loss_function], m, b, **kwargs)[0]
+
+def cross_validate(X, y, loss_function, m, b, folds=5, processes=None, seed=None, **kwargs):
+    """
+    Returns the result of CrossValidation.evaluate for loss_function on X, y
+    split into folds parts, using a pool of processes created for the call
+    """
+    with CrossValidation(X, y, folds, processes, seed) as cv:
+        return cv.evaluate(loss_function, m, b, **kwargs)
+
+def levels(var):
+    """
+    Returns list of lists grouping the variables var depends on by their
+    depth, the length of the longest path from them to var. The gradients of
+    the variables of one level only depend on the gradients of variables in
+    previous levels, so they can be computed independently.
+    """
+    top_sort = var._topological_order(False)
+    depth = {var: 0}
+    for node in top_sort:
+        for parent in node.parents.keys():
+            depth[parent] = max(depth.get(parent, 0), depth[node] + 1)
+    grouped = [[] for _ in range(max(depth.values()) + 1)]
+    for node in top_sort:
+        grouped[depth[node]].append(node)
+    return grouped
+
+def _accumulate(edges, dtype, policy):
+    """
+    Returns the sum of the contributions of the cotangents of the children of a
+    variable to its gradient, given as a list of pairs of partial derivative
+    and cotangent, with the dtype of the variable. Runs under the floating
+    point error policy, which is passed explicitly since the thread running it
+    may not be the one that started backward.
+    """
+    with _errstate(policy):
+        grad = np.zeros((), dtype=dtype)
+        for factor, cotangent in edges:
+            grad = grad + _vjp(factor, cotangent)
+        if policy == 'mask':
+            grad = _mask(grad)
+        return grad.astype(dtype, copy=False)
+
+def parallel_backward(var, executor=None, min_size=100000):
+    """
+    Propagates gradients backward from variable var like var.backward(), one
+    level of the graph at a time. Within a level, variables whose gradient
+    involves at least min_size array elements are computed in the thread
+    pool executor, where NumPy releases the GIL, while the rest are computed
+    in the calling thread. If executor is None, a pool with one thread per
+    processor is created for the call.
+    """
+    if executor is None:
+        with ThreadPoolExecutor(multiprocessing.cpu_count()) as pool:
+            return parallel_backward(var, pool, min_size)
+    var._refresh()
+    grouped = levels(var)
+    # the edges are taken from the parents of the children, which are the
+    # same inside and outside of a tape
+    children = {}
+    for level in grouped:
+        for child in level:
+            for parent, factor in child.parents.items():
+                children.setdefault(parent, []).append((child, factor))
+    policy = get_error_policy()
+    for level in grouped[1:]:
+        futures = []
+        for node in level:
+            edges = [(factor, var.grad_val[child]) for child, factor in children[node]]
+            size = np.sum([np.size(cotangent) for _, cotangent in edges])
+            if size >= min_size:
+                futures.append((node, executor.submit(_accumulate, edges, node.val.dtype, policy)))
+            else:
+                var.grad_val[node] = _accumulate(edges, node.val.dtype, policy)
+        for node, future in futures:
+            var.grad_val[node] = future.result()
@@ -1,18 +1,87 @@
-from lazydiff.vars import Var
+from lazydiff.vars import Var, gradients, _issparse, _errstate
 from lazydiff import ops
 import numpy as np
+import functools
 import time
 
+class Polynomial:
+    """
+    Polynomial features of the rows of the dense or sparse matrix X, as
+    given by ops.polynomial_terms, that are computed chunk_size rows at a
+    time when needed instead of being stored. Can be passed as X to the
+    loss functions, iterative_regression and LinearModel, with one
+    coefficient in m per term.
+    """
+
+    def __init__(self, X, degree = 2, interaction_only = False, chunk_size = 1024):
+        """
+        Initializes features of X
+        """
+        self.X = X
+        self.degree = degree
+        self.interaction_only = interaction_only
+        self.chunk_size = chunk_size
+        self.shape = (np.shape(X)[0], len(ops.polynomial_terms(np.shape(X)[1], degree, interaction_only)))
+
+    def __len__(self):
+        """
+        Returns the number of rows
+        """
+        return self.shape[0]
+
+    def __getitem__(self, rows):
+        """
+        Returns the features of the rows of X selected by rows
+        """
+        return Polynomial(self.X[rows], self.degree, self.interaction_only, self.chunk_size)
+
+    def matmul(self, m):
+        """
+        Returns variable representing the product of the features with
+        variable m
+        """
+        return ops.polynomial_matmul(self.X, m, self.degree, self.interaction_only, self.chunk_size)
+
+    def __matmul__(self, m):
+        """
+        Returns the product of the features with numpy array m, without
+        building a graph
+        """
+        m = np.asarray(m)
+        X = ops._operand(self.X)
+        return ops._PolynomialPartial(X, self.degree, self.interaction_only, self.chunk_size, m.shape).jvp(m)
+
+def _linear(X, m, b):
+    """
+    Returns variable representing the prediction mX+b for all rows of
+    the dense or sparse matrix X, or of Polynomial features, at once
+    """
+    prediction = X.matmul(m) if isinstance(X, Polynomial) else ops.matmul(X, m)
+    return prediction + ops.broadcast_to(b, prediction.val.shape)
+
+def _squared_residuals(X, y, m, b):
+    """
+    Returns variable representing the sum of the squared differences between
+    the predicted target mX+b and the observed target y.
+    If X is a scipy.sparse matrix or Polynomial features, the prediction
+    is computed with a single matrix product.
+    """
+    if _issparse(X) or isinstance(X, Polynomial):
+        prediction = _linear(X, m, b)
+        return ops.squared_error(prediction, np.asarray(y, dtype=prediction.val.dtype))
+    loss = Var(0)
+    for vec, y_i in zip(X,y):
+        loss = loss + (ops.sum(m*vec)+b-y_i)**2
+    return loss
+
 def MSE(X, y, m, b):
     """
     Returns Mean Squared Error where
     the predicted target is mX+b
     and y is the observed target variable
     """
-    loss = Var(0)
-    for vec, y_i in zip(X,y):
-        loss = loss + (ops.sum(m*vec)+b-y_i)**2
-    return loss/len(X)
+    loss = _squared_residuals(X, y, m, b)
+    return loss/np.shape(X)[0]
 
 def MSE_regularized(X, y, m, b, p = 1, C = 1):
     """
@@ -21,10 +90,8 @@ def MSE_regularized(X, y, m, b, p = 1, C = 1):
     y is the observed target variable
     and C is the weight in L-p norm of the vector m
     """
-    loss = Var(0)
-    for vec,y_i in zip(X,y):
-        loss = loss + (ops.sum(m*vec)+b-y_i)**2
-    return loss/(2*len(X)) + C*ops.norm(m, p=p)**p
+    loss = _squared_residuals(X, y, m, b)
+    return loss/(2*np.shape(X)[0]) + C*ops.norm(m, p=p)**p
 
 def lasso_loss(X, y, m, b, C = 1):
     """
@@ -44,9 +111,7 @@ def ridge_loss(X, y, m, b, C = 1):
     y is the observed target variable
     and C is the weight in L-2 norm of the vector m
     """
-    loss = Var(0)
-    for vec, y_i in zip(X,y):
-        loss = loss + (ops.sum(m*vec)+b-y_i)**2
+    loss = _squared_residuals(X, y, m, b)
     return loss + C*ops.norm(m,2)**2
 
 def elastic_loss(X, y, m, b, C = 1, l1_ratio = 0.5):
@@ -58,12 +123,35 @@ def elastic_loss(X, y, m, b, C = 1, l1_ratio = 0.5):
     C is the weight in L-2 norm of the vector m
     and L1_ratio is the ratio of L-1 norm loss
     """
-    loss = Var(0)
-    for vec,y_i in zip(X,y):
-        loss = loss + (ops.sum(m*vec)+b-y_i)**2
-    return loss/(2*len(X)) + C*l1_ratio*ops.norm(m, p=1) + 0.5*C*(1-l1_ratio)*ops.norm(m,2)**2
+    loss = _squared_residuals(X, y, m, b)
+    return loss/(2*np.shape(X)[0]) + C*l1_ratio*ops.norm(m, p=1) + 0.5*C*(1-l1_ratio)*ops.norm(m,2)**2
+
+def logistic_loss(X, y, m, b):
+    """
+    Returns the mean negative log likelihood of logistic regression
+    where the predicted probability of y being 1 is sigmoid(mX+b)
+    and y is the observed binary target variable
+    """
+    return ops.binary_cross_entropy(_linear(X, m, b), y)/np.shape(X)[0]
+
+def poisson_loss(X, y, m, b):
+    """
+    Returns the mean negative log likelihood of Poisson regression,
+    up to a constant, where the predicted mean is exp(mX+b)
+    and y is the observed count target variable
+    """
+    return ops.poisson_nll(_linear(X, m, b), y)/np.shape(X)[0]
 
-def gradient_descent(X, y, loss_function, m, b, lr = 0.1, forward = True):
+def softmax_loss(X, y, m, b):
+    """
+    Returns the mean negative log likelihood of multinomial logistic
+    regression where the predicted class probabilities are softmax(mX+b),
+    m is a matrix with one column and b a vector with one component
+    per class, and y is the vector of observed class indices
+    """
+    return ops.softmax_cross_entropy(_linear(X, m, b), y)/np.shape(X)[0]
+
+def gradient_descent(X, y, loss_function, m, b, lr = 0.1, forward = None, in_place = False):
     """ Performs one single update step of gradient descent
         Returns the updated parameters m, b and loss
         X is the matrix of independent variables
@@ -72,23 +160,160 @@ def gradient_descent(X, y, loss_function, m, b, lr = 0.1, forward = True):
         b is the intercept/bias of the prediction
         lr is the learning rate
         forward determines whether to perform forward mode
-        or reverse mode to find the gradient 
+        or reverse mode to find the gradient, or to pick
+        the mode needing fewer sweeps if None, the default.
+        Forward mode carries one tangent per component of
+        m, b, so it is only cheaper for a few parameters
+        in_place determines whether to update the values of m, b
+        and detach them from the graph of the loss instead of
+        returning new variables
     """
-    loss = loss_function(X, y, m, b)
-    if (forward):
-        # forward mode
-        m.forward()
-        b.forward()
-    else:
-        # reverse mode
-        loss.backward()
-    # clear cache by reinstantiating
-    m = Var(m.val-lr*loss.grad(m))
-    b = Var(b.val-lr*loss.grad(b))
+    m, b, loss, _, _ = _descent_step(X, y, loss_function, m, b, lr, forward, in_place)
     return m, b, loss
 
+def _descent_step(X, y, loss_function, m, b, lr, forward, in_place):
+    """
+    Performs gradient_descent and also returns the gradients
+    with respect to m, b it used
+    """
+    # apply the error policy once for all operations building the loss
+    with _errstate():
+        loss = loss_function(X, y, m, b)
+    # forward mode propagates tangents for all components of m, b at once
+    mode = None if forward is None else ('forward' if forward else 'reverse')
+    grad_m, grad_b = gradients(loss, [m, b], mode)
+    with _errstate():
+        m_val = m.val-lr*grad_m
+        b_val = b.val-lr*grad_b
+    if (in_place):
+        # clear cache by detaching the graph
+        for param, val in ((m, m_val), (b, b_val)):
+            param.detach()
+            param.zero_grad()
+            param.set_value(val)
+        return m, b, loss, grad_m, grad_b
+    # clear cache by reinstantiating
+    return Var(m_val), Var(b_val), loss, grad_m, grad_b
+
+def _evaluate(X, y, loss_function, m_val, b_val):
+    """
+    Returns new variables m, b with values m_val, b_val and the loss
+    at them, or None if evaluating the loss fails with a
+    floating point error
+    """
+    m = Var(m_val)
+    b = Var(b_val)
+    try:
+        with _errstate():
+            return m, b, loss_function(X, y, m, b)
+    except FloatingPointError:
+        return None
+
+def _adaptive_step(X, y, loss_function, m, b, loss, lr, forward, step, state):
+    """
+    Performs one step of gradient descent from m, b with the step
+    size chosen by step, 'armijo' or 'bb', given the loss at m, b.
+    Returns the new variables m, b, the gradients at the old ones
+    and the loss at the new ones, which the next step reuses.
+    state is a dictionary keeping the previous point and gradient
+    """
+    mode = None if forward is None else ('forward' if forward else 'reverse')
+    grad_m, grad_b = gradients(loss, [m, b], mode)
+    t = lr
+    if (step == 'armijo' and 'step' in state):
+        # try a longer step than the last accepted one first
+        t = min(lr, 2*state['step'])
+    if (step == 'bb' and 'point' in state):
+        # Barzilai-Borwein step size from the change of parameters and gradients
+        s = np.append(m.val, b.val) - state['point']
+        g = np.append(grad_m, grad_b) - state['grad']
+        with _errstate():
+            curvature = np.dot(s, g)
+        if (curvature > 0):
+            t = np.dot(s, s) / curvature
+    state['point'] = np.append(m.val, b.val)
+    state['grad'] = np.append(grad_m, grad_b)
+    norm2 = np.sum(grad_m**2) + np.sum(grad_b**2)
+    for _ in range(50):
+        with _errstate():
+            trial = _evaluate(X, y, loss_function, m.val-t*grad_m, b.val-t*grad_b)
+        # backtrack until the loss decreases enough (Armijo condition)
+        # or, for bb, until the loss can be evaluated
+        if (trial is not None and (step == 'bb' or trial[2].val <= loss.val - 1e-4*t*norm2)):
+            break
+        t = t/2
+    else:
+        raise FloatingPointError('Line search did not find a step decreasing the loss.')
+    state['step'] = t
+    new_m, new_b, new_loss = trial
+    return new_m, new_b, grad_m, grad_b, new_loss
+
+class Monitor:
+    """
+    Callback for iterative_regression that records m, b and the loss in
+    arrays allocated once, every every epochs, and stops the iteration early.
+    The iteration stops when the gradient norm is at most gtol, or when the
+    loss changed by at most rtol times its previous value for patience
+    epochs in a row. The reason for stopping is stored in reason and
+    the number of epochs seen in calls.
+    """
+
+    def __init__(self, epochs, rtol = 0, gtol = 0, patience = 1, every = 1):
+        """
+        Initializes monitor for at most epochs epochs
+        """
+        self.rtol = rtol
+        self.gtol = gtol
+        self.patience = patience
+        self.every = every
+        size = (epochs + every - 1) // every
+        self.epoch = np.zeros(size, dtype=int)
+        self.m = None
+        self.b = None
+        self.loss = np.zeros(size)
+        self.count = 0
+        self.calls = 0
+        self.stalled = 0
+        self.previous = None
+        self.reason = None
+
+    def __call__(self, epoch, m, b, loss, grad_m, grad_b):
+        """
+        Records epoch and returns True if the iteration should stop
+        """
+        self.calls += 1
+        if epoch % self.every == 0 and self.count < len(self.loss):
+            if self.m is None:
+                self.m = np.zeros((len(self.loss),) + np.shape(m.val))
+                self.b = np.zeros((len(self.loss),) + np.shape(b.val))
+            self.epoch[self.count] = epoch
+            self.m[self.count] = m.val
+            self.b[self.count] = b.val
+            self.loss[self.count] = loss.val
+            self.count += 1
+        if np.sqrt(np.sum(grad_m**2) + np.sum(grad_b**2)) <= self.gtol:
+            self.reason = 'gtol'
+            return True
+        if self.previous is not None and abs(loss.val - self.previous) <= self.rtol*abs(self.previous):
+            self.stalled += 1
+        else:
+            self.stalled = 0
+        self.previous = loss.val
+        if self.stalled >= self.patience:
+            self.reason = 'rtol'
+            return True
+        return False
+
+    def history(self):
+        """
+        Returns dictionary of the recorded epochs, m, b and losses
+        """
+        return {'epoch': self.epoch[:self.count], 'm': self.m[:self.count] if self.m is not None else None,
+                'b': self.b[:self.count] if self.b is not None else None, 'loss': self.loss[:self.count]}
+
 def iterative_regression(X, y, m, b, loss_function, lr = 0.1,\
-        epochs = 100, earlyStop = 0, forward = True, history = None):
+        epochs = 100, earlyStop = 0, forward = None, history = None, in_place = False,\
+        callback = None, step = 'fixed'):
     """
     Performs iterative regression with the given loss function
     minimizing the loss function w.r.t. the parameters
@@ -102,10 +327,25 @@ def iterative_regression(X, y, m, b, loss_function, lr = 0.1,\
     earlyStop is absolute tolerance to stop the iteration early
     Note that 0 means no early stopping
     forward determines whether to perform forward mode
-    or reverse mode to find the gradient 
+    or reverse mode to find the gradient, or to pick
+    the mode needing fewer sweeps if None
     history to store old values of m, b, loss 
     if provided a dictionary
+    in_place determines whether to update m, b in place
+    rather than replacing them with new variables every epoch
+    callback is called as callback(epoch, m, b, loss, grad_m, grad_b)
+    after every epoch and stops the iteration if it returns True,
+    e.g. a Monitor
+    step determines the step size: 'fixed' uses lr, 'armijo' halves
+    lr, or twice the previous step if smaller, until the loss decreases
+    enough (backtracking line search) and 'bb' uses the
+    Barzilai-Borwein step size, starting from lr.
+    Both reuse the loss evaluated at the accepted step for the next
+    gradient, and halve the step size instead of failing when the
+    loss overflows
     """
+    if step not in ('fixed', 'armijo', 'bb'):
+        raise ValueError("Step needs to be 'fixed', 'armijo' or 'bb'.")
     canStore = isinstance(history, dict)
     
     if (canStore):
@@ -113,10 +353,18 @@ def iterative_regression(X, y, m, b, loss_function, lr = 0.1,\
         history['b'] = []
         history['loss'] = []
 
+    params = (m, b)
+    state = {}
     loss = Var(0)
+    next_loss = loss_function(X, y, m, b) if step != 'fixed' else None
     for ep in range(epochs):
         prev = loss
-        m, b, loss = gradient_descent(X, y, loss_function, m, b, lr, forward)
+        if (step == 'fixed'):
+            m, b, loss, grad_m, grad_b = _descent_step(X, y, loss_function, m, b, lr, forward, in_place)
+        else:
+            loss = next_loss
+            m, b, grad_m, grad_b, next_loss = _adaptive_step(X, y, loss_function, m, b, loss, lr,
+                                                             forward, step, state)
         if (canStore):
             # store the m, b
             # change over each epoch
@@ -127,5 +375,131 @@ def iterative_regression(X, y, m, b, loss_function, lr = 0.1,\
         # check if absolute tolerance meets early stopping condition
         if (abs(loss.val - prev.val) < earlyStop):
             break
+        if (callback is not None and callback(ep, m, b, loss, grad_m, grad_b)):
+            break
+    if (in_place and step != 'fixed'):
+        # copy the result into the variables that were passed in
+        for param, result in zip(params, (m, b)):
+            param.detach()
+            param.zero_grad()
+            param.set_value(result.val)
+        m, b = params
     # return coefficient and intercept
     return m, b, loss
+
+def regularization_path(X, y, loss_function, Cs, m, b, lr = 0.1, epochs = 100,\
+        tol = 1e-6, forward = False, step = 'fixed'):
+    """
+    Fits loss_function, which takes the weight of the regularization
+    as keyword argument C like lasso_loss, ridge_loss and elastic_loss,
+    for every value in Cs from the largest to the smallest
+
+    Returns dictionary with the values of C in the order they were fitted
+    and the arrays of the coefficients m, intercepts b, losses and
+    numbers of epochs for each of them
+    X, y are the dependent and independent variables
+    m, b are the coefficients and intercept to start from
+    Each fit starts from the solution of the previous one (warm start),
+    which is close when C changes little, and stops when the loss
+    changes by at most tol relative to its value or after epochs epochs
+    lr, forward and step are passed to iterative_regression
+    """
+    Cs = np.sort(np.asarray(Cs, dtype=float))[::-1]
+    path = {'C': Cs, 'm': np.zeros((len(Cs),) + np.shape(m.val)), 'b': np.zeros((len(Cs),) + np.shape(b.val)),
+            'loss': np.zeros(len(Cs)), 'epochs': np.zeros(len(Cs), dtype=int)}
+    for i, C in enumerate(Cs):
+        monitor = Monitor(epochs, rtol = tol, every = epochs)
+        m, b, loss = iterative_regression(X, y, m, b, functools.partial(loss_function, C = C), lr,
+                                          epochs, 0, forward, callback = monitor, step = step)
+        path['m'][i] = m.val
+        path['b'][i] = b.val
+        path['loss'][i] = loss.val
+        path['epochs'][i] = monitor.calls
+    return path
+
+def _xlogy(y, mu):
+    """
+    Returns y*log(y/mu), which is 0 where the count y is 0
+    """
+    positive = y > 0
+    return np.where(positive, y * np.log(np.where(positive, y, 1) / mu), 0)
+
+class LinearModel:
+    """
+    Regression model with coefficients m and intercept b, e.g. returned by
+    iterative_regression, predicting link(mX+b) with NumPy only, without
+    building a graph. link is 'identity' for the squared error losses,
+    'logistic' for the probabilities of logistic_loss, 'exp' for the means
+    of poisson_loss and 'softmax' for the class probabilities of softmax_loss
+    """
+
+    links = ('identity', 'logistic', 'exp', 'softmax')
+
+    def __init__(self, m, b, link = 'identity'):
+        """
+        Initializes model from variables or arrays m, b
+        """
+        if link not in self.links:
+            raise ValueError("Link needs to be 'identity', 'logistic', 'exp' or 'softmax'.")
+        self.m = np.asarray(m.val if isinstance(m, Var) else m)
+        self.b = np.asarray(b.val if isinstance(b, Var) else b)
+        self.link = link
+
+    @classmethod
+    def fit(cls, X, y, loss_function, m, b, link = 'identity', **kwargs):
+        """
+        Returns model fitted by iterative_regression on X, y starting from m, b,
+        with the keyword arguments passed to iterative_regression
+        """
+        m, b, _ = iterative_regression(X, y, m, b, loss_function, **kwargs)
+        return cls(m, b, link)
+
+    def _predict(self, X):
+        """
+        Returns predictions for the rows of dense or sparse matrix X at once
+        """
+        val = X @ self.m + self.b
+        if self.link == 'logistic':
+            return ops._logistic(val)
+        if self.link == 'exp':
+            return np.exp(val)
+        if self.link == 'softmax':
+            exps = np.exp(val - np.max(val, axis=-1, keepdims=True))
+            return exps / np.sum(exps, axis=-1, keepdims=True)
+        return val
+
+    def predict(self, X, chunk_size = None):
+        """
+        Returns the predictions for the rows of dense or sparse matrix X,
+        computed chunk_size rows at a time if chunk_size is given, which
+        bounds the memory of the temporaries to that of chunk_size rows
+        """
+        rows = np.shape(X)[0]
+        if chunk_size is None or chunk_size >= rows:
+            return self._predict(X)
+        first = self._predict(X[:chunk_size])
+        predictions = np.empty((rows,) + first.shape[1:], dtype=first.dtype)
+        predictions[:chunk_size] = first
+        for start in range(chunk_size, rows, chunk_size):
+            predictions[start:start + chunk_size] = self._predict(X[start:start + chunk_size])
+        return predictions
+
+    def score(self, X, y, chunk_size = None):
+        """
+        Returns how well the predictions for X match the observed y:
+        the coefficient of determination R^2 for link 'identity',
+        the accuracy for 'logistic' and 'softmax', where the predicted
+        label is the most probable one, and the fraction of Poisson
+        deviance explained for 'exp'
+        """
+        predictions = self.predict(X, chunk_size)
+        y = np.asarray(y)
+        if self.link == 'logistic':
+            return np.mean((predictions > 0.5) == y)
+        if self.link == 'softmax':
+            return np.mean(np.argmax(predictions, axis=-1) == y)
+        if self.link == 'exp':
+            deviance = np.sum(_xlogy(y, predictions) - y + predictions)
+            null_deviance = np.sum(_xlogy(y, np.mean(y)))
+            return 1 - deviance / null_deviance
+        return 1 - np.sum((y - predictions) ** 2) / np.sum((y - np.mean(y)) ** 2)
@@ -0,0 +1,197 @@
+import numpy as np
+import os
+import struct
+import zipfile
+from lazydiff.vars import Var, Partial, _issparse
+from lazydiff.optimize import _ancestors
+from lazydiff import ops
+
+# kinds of partial derivatives that can be saved
+_NUMERIC, _MATMUL, _BROADCAST = 0, 1, 2
+
+def _pack(arrays):
+    """
+    Packs list of arrays into a flat data array, the offsets of each array
+    in it, the number of dimensions of each array, their concatenated shapes
+    and their dtypes, since the data array has a dtype all of them fit in
+    """
+    arrays = [np.asarray(array) for array in arrays]
+    offsets = np.cumsum([0] + [array.size for array in arrays])
+    ndims = np.array([array.ndim for array in arrays], dtype=np.int64)
+    dims = np.array([dim for array in arrays for dim in array.shape], dtype=np.int64)
+    dtypes = np.array([array.dtype.str for array in arrays], dtype='U8')
+    data = np.concatenate([array.ravel() for array in arrays]) if arrays else np.zeros(0)
+    return data, offsets, ndims, dims, dtypes
+
+def _unpack(data, offsets, ndims, dims, dtypes=None):
+    """
+    Inverse of _pack. Returns list of arrays, which are views of data
+    unless they need to be cast back to their dtype in dtypes.
+    """
+    arrays = []
+    start = 0
+    for i, ndim in enumerate(ndims):
+        shape = tuple(dims[start:start + ndim])
+        start += ndim
+        array = data[offsets[i]:offsets[i + 1]].reshape(shape)
+        if dtypes is not None and array.dtype != dtypes[i]:
+            dtype = np.dtype(dtypes[i])
+            if np.iscomplexobj(array) and dtype.kind != 'c':
+                array = array.real
+            array = array.astype(dtype)
+        arrays.append(array)
+    return arrays
+
+def _mmap_member(path, name, mode):
+    """
+    Returns memory map of array name stored without compression in the .npz
+    file at path opened with mode, or None if it cannot be mapped
+    """
+    with zipfile.ZipFile(path) as archive:
+        info = archive.getinfo(name + '.npy')
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+    with open(path, 'rb') as f:
+        f.seek(info.header_offset)
+        name_length, extra_length = struct.unpack('<HH', f.read(30)[26:])
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+        if np.lib.format.read_magic(f) != (1, 0):
+            return None
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        offset = f.tell()
+    if dtype.hasobject or 0 in shape:
+        return None
+    return np.memmap(path, dtype=dtype, mode=mode, offset=offset, shape=shape,
+                     order='F' if fortran_order else 'C')
+
+def _matrix_arrays(matrix):
+    """
+    Returns list of arrays describing the dense array or scipy.sparse
+    matrix matrix, starting with a flag telling whether it is sparse
+    """
+    if _issparse(matrix):
+        matrix = matrix.tocsr()
+        return [np.array(1), matrix.data, matrix.indices, matrix.indptr, np.array(matrix.shape)]
+    return [np.array(0), matrix]
+
+def _read_matrix(arrays):
+    """
+    Returns matrix described by the next arrays of iterator arrays, as
+    returned by _matrix_arrays
+    """
+    if not next(arrays):
+        return next(arrays)
+    import scipy.sparse
+    data, indices, indptr, shape = next(arrays), next(arrays), next(arrays), next(arrays)
+    return scipy.sparse.csr_matrix((data, indices.astype(np.int64), indptr.astype(np.int64)),
+                                   shape=tuple(shape.astype(np.int64)))
+
+def _encode(factor):
+    """
+    Returns kind of partial derivative factor and list of arrays describing
+    it. Raises error for partial derivatives that cannot be saved.
+    """
+    if isinstance(factor, ops._MatmulPartial):
+        return _MATMUL, [np.array(factor.left)] + _matrix_arrays(factor.operand) + _matrix_arrays(factor.other)
+    if isinstance(factor, ops._BroadcastPartial):
+        return _BROADCAST, [np.array(factor.shape, dtype=np.int64), np.array(factor.result_shape, dtype=np.int64)]
+    if isinstance(factor, Partial) or _issparse(factor):
+        raise ValueError('Cannot save graph containing partial derivatives of type {}.'.format(type(factor).__name__))
+    return _NUMERIC, [factor]
+
+def _decode(kind, arrays):
+    """
+    Returns partial derivative of kind kind described by the list arrays
+    """
+    if kind == _MATMUL:
+        arrays = iter(arrays)
+        left = bool(next(arrays))
+        operand = _read_matrix(arrays)
+        return ops._MatmulPartial(operand, _read_matrix(arrays), left)
+    if kind == _BROADCAST:
+        shape, result_shape = arrays
+        return ops._BroadcastPartial(tuple(shape.astype(np.int64)), tuple(result_shape.astype(np.int64)))
+    return arrays[0]
+
+def save(file, *vars):
+    """
+    Saves the graph of the variables vars to file in .npz format.
+    The values, seeds and partial derivatives of every variable the given
+    variables depend on are stored as flat arrays together with the edges of
+    the graph, so load can rebuild it without rerunning the computation.
+    Partial derivatives of ops.matmul and ops.broadcast_to, including those
+    of the losses in regression, are saved with the arrays they hold.
+    Raises error if the graph contains other partial derivatives that are
+    not numerical, such as those of checkpointed segments, custom_op and
+    ops.polynomial_matmul, or sparse values.
+    """
+    nodes = []
+    index = {}
+    for var in vars:
+        if not isinstance(var, Var):
+            raise TypeError('Inputs needs to be Var object.')
+        for node in _ancestors(var):
+            if node not in index:
+                index[node] = len(nodes)
+                nodes.append(node)
+    if any(_issparse(node.val) for node in nodes):
+        raise ValueError('Cannot save graph containing sparse values.')
+    edges = []
+    kinds = []
+    counts = []
+    partials = []
+    for node in nodes:
+        for parent, factor in node.parents.items():
+            kind, factor_arrays = _encode(factor)
+            edges.append((index[parent], index[node]))
+            kinds.append(kind)
+            counts.append(len(factor_arrays))
+            partials.extend(factor_arrays)
+    arrays = {
+        'outputs': np.array([index[var] for var in vars], dtype=np.int64),
+        'edges': np.array(edges, dtype=np.int64).reshape(-1, 2),
+        'kinds': np.array(kinds, dtype=np.int64),
+        'partial_counts': np.array(counts, dtype=np.int64),
+    }
+    for name, group in [('values', [node.val for node in nodes]),
+                        ('seeds', [node.grad_val[node] for node in nodes]),
+                        ('partials', partials)]:
+        data, offsets, ndims, dims, dtypes = _pack(group)
+        arrays[name] = data
+        arrays[name + '_offsets'] = offsets
+        arrays[name + '_ndims'] = ndims
+        arrays[name + '_dims'] = dims
+        arrays[name + '_dtypes'] = dtypes
+    np.savez(file, **arrays)
+
+def load(file, mmap_mode='r'):
+    """
+    Loads graph saved by save from file and returns list of the variables that
+    were passed to save, in the same order.
+    If file is a path and mmap_mode is not None, values and partial
+    derivatives are memory mapped instead of read into memory.
+    """
+    mapped = {}
+    if mmap_mode is not None and isinstance(file, (str, os.PathLike)):
+        for name in ('values', 'partials'):
+            data = _mmap_member(file, name, mmap_mode)
+            if data is not None:
+                mapped[name] = data
+    with np.load(file) as archive:
+        arrays = {name: mapped[name] if name in mapped else archive[name] for name in archive.files}
+    groups = {}
+    for name in ('values', 'seeds', 'partials'):
+        groups[name] = _unpack(arrays[name], arrays[name + '_offsets'], arrays[name + '_ndims'],
+                               arrays[name + '_dims'], arrays.get(name + '_dtypes'))
+    nodes = []
+    for val, seed in zip(groups['values'], groups['seeds']):
+        node = Var(0., seed=seed, dtype=val.dtype)
+        node.val = val
+        nodes.append(node)
+    edges = arrays['edges']
+    kinds = arrays.get('kinds', np.zeros(len(edges), dtype=np.int64))
+    bounds = np.cumsum([0] + list(arrays.get('partial_counts', np.ones(len(edges), dtype=np.int64))))
+    for i, (parent, child) in enumerate(edges):
+        factor = _decode(kinds[i], groups['partials'][bounds[i]:bounds[i + 1]])
+        nodes[child].parents[nodes[parent]] = nodes[parent].children[nodes[child]] = factor
+    return [nodes[i] for i in arrays['outputs']]
@@ -0,0 +1,158 @@
+import numpy as np
+import asyncio
+import time
+from lazydiff.vars import Var, Tape, _resolve_dtype
+
+def evaluate(fn, inputs):
+    """
+    Returns the value of fn applied to variables with values inputs and the
+    list of its gradients with respect to each of them, using reverse mode.
+    The graph is built inside a tape, so that variables shared between
+    requests, like parameters fn closes over, do not collect the graphs of
+    all requests and can be used by concurrent requests.
+    """
+    with Tape():
+        vars = [Var(val) for val in inputs]
+        output = fn(*vars)
+        output.backward()
+    grads = [output.grad_val[var] if var in output.grad_val else np.zeros_like(var.val) for var in vars]
+    return output.val, grads
+
+def _evaluate_batch(fn, batch):
+    """
+    Evaluates fn once on vectors stacking the scalar inputs of every request
+    in batch, assuming fn is elementwise. Returns list of results of evaluate
+    for each request, or None if the output of fn does not have one
+    component per request, in which case the batch needs to be evaluated
+    request by request.
+    """
+    stacked = [np.array(args) for args in zip(*batch)]
+    val, grads = evaluate(fn, stacked)
+    shape = (len(batch),)
+    if np.shape(val) != shape or any(np.shape(grad) != shape for grad in grads):
+        return None
+    return [(val[i], [grad[i] for grad in grads]) for i in range(len(batch))]
+
+class GradientService:
+    """
+    Evaluates functions built from lazydiff operations and their gradients
+    from asyncio code without blocking the event loop. Graph construction and
+    backward run in executor, by default the event loop's thread pool.
+    Concurrent requests with batch=True for the same function with scalar
+    inputs that arrive in the same iteration of the event loop are evaluated
+    together on vectors of inputs, up to max_batch_size requests at once.
+    This is only correct for elementwise functions, which the caller needs
+    to guarantee: a function combining the components of its inputs, such
+    as x * ops.sum(x), can keep the shape of the batch and would return
+    wrong results without any error.
+    """
+
+    def __init__(self, executor=None, max_batch_size=1024):
+        """
+        Initializes service running evaluations in executor
+        """
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.pending = {}
+        self.tasks = set()
+        self.counts = {'requests': 0, 'batches': 0, 'errors': 0}
+        self.totals = {'batch_size': 0, 'queue_time': 0., 'latency': 0.}
+        self.max_latency = 0.
+
+    async def grad(self, fn, inputs, batch=False):
+        """
+        Returns the value of fn at inputs and the list of its gradients with
+        respect to each input. Pass batch=True only if fn is elementwise, to
+        allow evaluating it together with concurrent requests.
+        """
+        loop = asyncio.get_running_loop()
+        inputs = [np.asarray(val, dtype=_resolve_dtype(val)) for val in inputs]
+        request = (inputs, loop.create_future(), time.perf_counter())
+        self.counts['requests'] += 1
+        if batch and all(val.ndim == 0 for val in inputs):
+            key = (fn, len(inputs))
+            queue = self.pending.setdefault(key, [])
+            queue.append(request)
+            if len(queue) == 1:
+                loop.call_soon(self._flush, key)
+            elif len(queue) >= self.max_batch_size:
+                self._flush(key)
+        else:
+            self._start(fn, [request])
+        return await request[1]
+
+    def _start(self, fn, requests):
+        """
+        Starts evaluation of requests for fn, keeping a reference to the task
+        until it is done
+        """
+        task = asyncio.get_running_loop().create_task(self._run(fn, requests))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def _flush(self, key):
+        """
+        Starts evaluation of the requests waiting for the function in key
+        """
+        requests = self.pending.pop(key, None)
+        if requests:
+            self._start(key[0], requests)
+
+    async def _run(self, fn, requests):
+        """
+        Evaluates fn for requests in the executor and resolves their futures
+        """
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        self.counts['batches'] += 1
+        self.totals['batch_size'] += len(requests)
+        results = None
+        if len(requests) > 1:
+            try:
+                results = await loop.run_in_executor(self.executor, _evaluate_batch, fn,
+                                                     [inputs for inputs, _, _ in requests])
+            except Exception:
+                results = None
+        if results is None:
+            results = await asyncio.gather(*[loop.run_in_executor(self.executor, evaluate, fn, inputs)
+                                             for inputs, _, _ in requests], return_exceptions=True)
+        finished = time.perf_counter()
+        for (_, future, arrived), result in zip(requests, results):
+            self.totals['queue_time'] += started - arrived
+            self.totals['latency'] += finished - arrived
+            self.max_latency = max(self.max_latency, finished - arrived)
+            if isinstance(result, Exception):
+                self.counts['errors'] += 1
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def metrics(self):
+        """
+        Returns dictionary with the number of requests, batches and errors so
+        far, the number of requests waiting to be batched, the mean batch size,
+        the mean time requests waited before evaluation started, and the mean
+        and maximum latency of requests, in seconds
+        """
+        done = max(self.totals['batch_size'], 1)
+        return {
+            'requests': self.counts['requests'],
+            'batches': self.counts['batches'],
+            'errors': self.counts['errors'],
+            'pending': sum(len(queue) for queue in self.pending.values()),
+            'mean_batch_size': self.totals['batch_size'] / max(self.counts['batches'], 1),
+            'mean_queue_time': self.totals['queue_time'] / done,
+            'mean_latency': self.totals['latency'] / done,
+            'max_latency': self.max_latency,
+        }
+
+_default_service = GradientService()
+
+async def agrad(fn, inputs, batch=False, service=None):
+    """
+    Returns the value of fn at inputs and the list of its gradients with
+    respect to each input, evaluated by service without blocking the event
+    loop. The shared default service is used if service is None. Pass
+    batch=True only if fn is elementwise.
+    """
+    return await (service or _default_service).grad(fn, inputs, batch)
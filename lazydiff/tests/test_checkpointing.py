@@ -0,0 +1,95 @@
+import pytest
+import numpy as np
+import lazydiff
+from lazydiff import ops, regression
+from lazydiff.vars import Var, gradients
+from lazydiff.checkpointing import checkpoint
+
+def step(x):
+    return x + 0.1 * ops.sin(x)
+
+def segment(x):
+    for _ in range(5):
+        x = step(x)
+    return x
+
+def test_checkpoint_value():
+    x = Var([0.5, 1., 2.])
+    y = checkpoint(segment, x)
+    assert y.val == pytest.approx(segment(Var([0.5, 1., 2.])).val)
+
+def test_checkpoint_exported():
+    assert lazydiff.checkpoint is checkpoint
+
+def test_checkpoint_backward():
+    x1 = Var([0.5, 1., 2.])
+    y1 = segment(segment(x1))
+    y1.backward()
+    x2 = Var([0.5, 1., 2.])
+    y2 = checkpoint(segment, checkpoint(segment, x2))
+    y2.backward()
+    assert y2.grad(x2) == pytest.approx(y1.grad(x1))
+
+def test_checkpoint_forward():
+    x1 = Var([0.5, 1., 2.])
+    y1 = segment(segment(x1))
+    x1.forward()
+    x2 = Var([0.5, 1., 2.])
+    y2 = checkpoint(segment, checkpoint(segment, x2))
+    x2.forward()
+    assert y2.grad(x2) == pytest.approx(y1.grad(x1))
+
+def test_checkpoint_forward_batch():
+    X = np.ones((2, 3))
+    y = np.ones(2)
+    fn = lambda m, b: ops.sum((m * 2 + b) ** 2)
+    loss = lambda X, y, m, b: checkpoint(fn, m, b)
+    m = Var([1., 2., 3.])
+    b = Var(0.5)
+    new_m, new_b, _ = regression.gradient_descent(X, y, loss, m, b, forward=True)
+    expected_m, expected_b, _ = regression.gradient_descent(X, y, lambda X, y, m, b: fn(m, b), m, b, forward=True)
+    assert new_m.val == pytest.approx(expected_m.val)
+    assert new_b.val == pytest.approx(expected_b.val)
+    grad_m, grad_b = gradients(loss(X, y, m, b), [m, b], 'forward')
+    assert grad_m == pytest.approx(4 * (m.val * 2 + 0.5))
+    assert grad_b == pytest.approx(np.sum(2 * (m.val * 2 + 0.5)))
+
+def test_checkpoint_multiple_inputs():
+    x1 = Var(2.)
+    x2 = Var(3.)
+    y = checkpoint(lambda a, b: a * ops.exp(b) + a ** 2, x1, x2)
+    y.backward()
+    assert y.grad(x1) == pytest.approx(np.exp(3.) + 4.)
+    assert y.grad(x2) == pytest.approx(2. * np.exp(3.))
+
+def test_checkpoint_repeated_input():
+    x = Var(3.)
+    y = checkpoint(lambda a, b: a * b, x, x)
+    y.backward()
+    assert y.grad(x) == pytest.approx(6.)
+    x.forward()
+    assert y.grad(x) == pytest.approx(6.)
+
+def test_checkpoint_does_not_keep_intermediates():
+    x = Var([1., 2.])
+    y = checkpoint(segment, x)
+    assert list(x.children.keys()) == [y]
+    assert set(y.parents.keys()) == {x}
+
+def test_checkpoint_invalid_input():
+    with pytest.raises(TypeError):
+        checkpoint(segment, 1.)
+
+def test_checkpoint_invalid_output():
+    with pytest.raises(TypeError):
+        checkpoint(lambda x: 1., Var(1.))
+
+def test_checkpoint_keeps_outer_graph():
+    a = Var(2.)
+    b = a * 3
+    x = Var(1.)
+    y = checkpoint(lambda v: v * b, x)
+    y.backward()
+    assert y.grad(x) == pytest.approx(6.)
+    assert list(b.parents.keys()) == [a]
+    assert list(b.children.keys()) == []
@@ -0,0 +1,22 @@
+import sys
+import subprocess
+import pytest
+import lazydiff
+from lazydiff.vars import Var
+
+def test_import_is_lazy():
+    code = "import sys, lazydiff; print('numpy' in sys.modules, 'lazydiff.vars' in sys.modules)"
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout
+    assert output.split() == ['False', 'False']
+
+def test_names():
+    assert lazydiff.Var is Var
+    assert lazydiff.ops.sin(lazydiff.Var(0.)).val == 0
+    from lazydiff import checkpoint
+    assert checkpoint is lazydiff.checkpointing.checkpoint
+    assert 'agrad' in dir(lazydiff)
+    assert lazydiff.custom_op is lazydiff.ops.custom_op
+
+def test_unknown_name():
+    with pytest.raises(AttributeError):
+        lazydiff.nonexistent
@@ -0,0 +1,104 @@
+import pytest
+import numpy as np
+import scipy.sparse
+from lazydiff import ops
+from lazydiff.vars import Var
+from lazydiff.jacobian import sparsity_pattern, color_columns, jacobian
+
+def residuals(x):
+    """
+    Banded residuals of a finite difference discretization of u'' = sin(u)
+    """
+    n = len(x)
+    r = []
+    for i in range(n):
+        left = x[i - 1] if i > 0 else 0.
+        right = x[i + 1] if i < n - 1 else 0.
+        r.append(left - 2 * x[i] + right - ops.sin(x[i]))
+    return r
+
+def dense_jacobian(outputs, inputs):
+    J = np.zeros((len(outputs), len(inputs)))
+    for j, var in enumerate(inputs):
+        var.forward()
+        for i, output in enumerate(outputs):
+            if var in output.grad_val:
+                J[i, j] = output.grad(var)
+    return J
+
+def test_sparsity_pattern():
+    x = [Var(v) for v in np.linspace(0, 1, 5)]
+    pattern = sparsity_pattern(residuals(x), x)
+    expected = np.eye(5) + np.eye(5, k=1) + np.eye(5, k=-1)
+    assert np.all(pattern.toarray() == expected.astype(bool))
+
+def test_color_columns_tridiagonal():
+    x = [Var(v) for v in np.linspace(0, 1, 10)]
+    colors = color_columns(sparsity_pattern(residuals(x), x))
+    assert colors.max() == 2
+    assert np.all(colors == np.arange(10) % 3)
+
+@pytest.mark.parametrize('mode', [None, 'forward', 'reverse'])
+def test_jacobian_banded(mode):
+    x = [Var(v) for v in np.linspace(0, 1, 8)]
+    r = residuals(x)
+    J = jacobian(r, x, mode=mode)
+    assert scipy.sparse.issparse(J)
+    assert J.nnz == 8 * 3 - 2
+    assert J.toarray() == pytest.approx(dense_jacobian(r, x))
+
+@pytest.mark.parametrize('mode', ['forward', 'reverse'])
+def test_jacobian_dense(mode):
+    x = [Var(1.), Var(2.), Var(3.)]
+    y = [x[0] * x[1] * x[2], ops.exp(x[0]) + x[1], ops.sin(x[2])]
+    assert jacobian(y, x, mode=mode).toarray() == pytest.approx(dense_jacobian(y, x))
+
+def test_jacobian_output_is_input():
+    x = [Var(1.), Var(2.)]
+    y = [x[1], x[0] ** 2]
+    assert jacobian(y, x).toarray() == pytest.approx(np.array([[0, 1], [2, 0]]))
+
+def test_jacobian_invalid_mode():
+    x = [Var(1.)]
+    with pytest.raises(ValueError):
+        jacobian([ops.sin(x[0])], x, mode='sideways')
+
+def numeric_jacobian(fn, x, step=1e-6):
+    J = np.zeros((np.size(fn(x)), np.size(x)))
+    for j in range(np.size(x)):
+        shift = np.zeros(np.size(x))
+        shift[j] = step
+        J[:, j] = (np.ravel(fn(x + shift)) - np.ravel(fn(x - shift))) / (2 * step)
+    return J
+
+@pytest.mark.parametrize('mode', [None, 'forward', 'reverse'])
+def test_jacobian_elementwise_vector(mode):
+    x = Var(np.linspace(0.5, 2, 20))
+    y = ops.sin(x) * x + ops.exp(x / 4)
+    pattern = sparsity_pattern([y], [x])
+    assert np.all(pattern.toarray() == np.eye(20, dtype=bool))
+    assert color_columns(pattern).max() == 0
+    J = jacobian([y], [x], mode=mode)
+    assert J.toarray() == pytest.approx(np.diag(np.cos(x.val) * x.val + np.sin(x.val) + np.exp(x.val / 4) / 4))
+
+@pytest.mark.parametrize('mode', ['forward', 'reverse'])
+def test_jacobian_reductions_and_broadcasts(mode):
+    x = Var([1., 2., 3.])
+    s = Var(0.5)
+    y = x * ops.sum(x) + s * x
+    z = ops.sum(ops.sin(x)) * s
+    J = jacobian([y, z], [x, s], mode=mode).toarray()
+    expected = numeric_jacobian(lambda v: np.append(v[:3] * np.sum(v[:3]) + v[3] * v[:3],
+                                                    np.sum(np.sin(v[:3])) * v[3]), np.array([1., 2., 3., 0.5]))
+    assert J.shape == (4, 4)
+    assert J == pytest.approx(expected, abs=1e-6)
+
+def test_jacobian_matmul():
+    A = np.random.rand(4, 3)
+    x = Var(np.random.rand(3))
+    y = ops.sin(ops.matmul(A, x))
+    assert jacobian([y], [x]).toarray() == pytest.approx(np.cos(A @ x.val)[:, None] * A)
+
+def test_jacobian_requires_vars():
+    with pytest.raises(TypeError):
+        jacobian([1.], [Var(1.)])
@@ -188,3 +188,40 @@ def test_composite_trig():
     x.forward()
     assert np.all(x2.val == pytest.approx(x3.val))
     assert np.all(x2.grad(x) == pytest.approx(x3.grad(x)))
+
+def test_logistic_stable():
+    var1 = Var(-1000)
+    var2 = ops.logistic(var1)
+    var2.backward()
+    assert var2.val == 0
+    assert var2.grad(var1) == 0
+
+def test_softplus():
+    var1 = Var(0)
+    var2 = ops.softplus(var1)
+    var2.backward()
+    assert var2.val == pytest.approx(np.log(2))
+    assert var2.grad(var1) == pytest.approx(0.5)
+
+def test_softplus_stable():
+    var1 = Var(1000)
+    var2 = ops.softplus(var1)
+    var2.backward()
+    assert var2.val == pytest.approx(1000)
+    assert var2.grad(var1) == pytest.approx(1)
+
+def test_squared_error_constant():
+    var1 = Var(3)
+    var2 = ops.squared_error(var1, 1)
+    var2.backward()
+    assert var2.val == 4
+    assert var2.grad(var1) == 4
+
+def test_squared_error_vars():
+    var1 = Var(3)
+    var2 = Var(1)
+    var3 = ops.squared_error(var1, var2)
+    var3.backward()
+    assert var3.val == 4
+    assert var3.grad(var1) == 4
+    assert var3.grad(var2) == -4
@@ -0,0 +1,118 @@
+import pytest
+import numpy as np
+from lazydiff import ops
+from lazydiff import optimize
+from lazydiff.vars import Var
+from lazydiff.checkpointing import checkpoint
+
+def test_count_nodes():
+    x = Var([1, 2])
+    y = ops.sin(x) * x
+    assert optimize.count_nodes(y) == 3
+    assert optimize.count_nodes(x) == 1
+
+def test_fuse_chain():
+    x = Var([0.5, 1.5])
+    y = ops.exp(ops.cos(ops.sin(x)))
+    optimize.fuse(y)
+    assert optimize.count_nodes(y) == 2
+    y.backward()
+    expected = np.exp(np.cos(np.sin(x.val))) * -np.sin(np.sin(x.val)) * np.cos(x.val)
+    assert y.grad(x) == pytest.approx(expected)
+
+def test_fuse_reports_removed():
+    x = Var(2.)
+    y = ops.log(ops.exp(ops.sin(x)))
+    before = optimize.count_nodes(y)
+    removed = optimize.fuse(y)
+    assert removed == 2
+    assert optimize.count_nodes(y) == before - removed
+
+def test_fuse_merges_parallel_paths():
+    x = Var(2.)
+    y = x * ops.exp(x)
+    assert optimize.fuse(y) == 1
+    assert list(y.parents.keys()) == [x]
+    x.forward()
+    assert y.grad(x) == pytest.approx(3 * np.exp(2.))
+
+def test_fuse_shared_nodes():
+    x = Var(2.)
+    s = ops.sin(x)
+    y = s ** 2 + ops.cos(s)
+    optimize.fuse(y)
+    y.backward()
+    assert optimize.count_nodes(y) == 2
+    assert y.grad(x) == pytest.approx((2 * np.sin(2.) - np.sin(np.sin(2.))) * np.cos(2.))
+
+def test_fuse_keeps_multiple_children():
+    x = Var(2.)
+    s = ops.sin(x)
+    y = s * x
+    z = ops.exp(s)
+    optimize.fuse(y)
+    assert optimize.count_nodes(y) == 3
+    assert z in s.children
+
+def test_fuse_skips_partials():
+    x = Var(2.)
+    y = ops.exp(checkpoint(ops.sin, x))
+    assert optimize.fuse(y) == 0
+
+def test_cse_merges_duplicates():
+    x = Var([1., 2.])
+    y = ops.sin(x) + ops.sin(x)
+    assert optimize.eliminate_common_subexpressions(y) == 1
+    assert optimize.count_nodes(y) == 3
+    y.backward()
+    assert y.grad(x) == pytest.approx(2 * np.cos(x.val))
+
+def test_cse_merges_nested_duplicates():
+    x = Var(1.)
+    y = Var(2.)
+    z = ops.exp(x * y) * ops.exp(x * y)
+    assert optimize.eliminate_common_subexpressions(z) == 2
+    z.backward()
+    assert z.grad(x) == pytest.approx(2 * 2. * np.exp(4.))
+    assert z.grad(y) == pytest.approx(2 * 1. * np.exp(4.))
+
+def test_cse_keeps_different_ops():
+    x = Var(1.)
+    y = ops.sin(x) + ops.tan(x)
+    assert optimize.eliminate_common_subexpressions(y) == 0
+
+def test_cse_keeps_leaves():
+    x1 = Var(1.)
+    x2 = Var(1.)
+    y = x1 + x2
+    assert optimize.eliminate_common_subexpressions(y) == 0
+
+def test_fold_constants():
+    m = Var(2.)
+    c = ops.exp(Var(0.)) * 3
+    y = m * c + ops.sin(Var(1.))
+    assert optimize.fold_constants(y, [m]) == 5
+    assert optimize.count_nodes(y) == 3
+    y.backward()
+    assert y.val == pytest.approx(6 + np.sin(1.))
+    assert y.grad(m) == pytest.approx(3.)
+
+def test_simplify_report():
+    m = Var([1., 2.])
+    y = ops.norm(m, 2) ** 2 + ops.norm(m, 2) ** 2 + Var(0)
+    report = optimize.simplify(y, wrt=[m])
+    assert report['before'] == 8
+    assert report['folded'] == 1
+    assert report['deduplicated'] == 2
+    assert report['after'] == report['before'] - report['folded'] - report['deduplicated'] - report['fused']
+    y.backward()
+    assert y.grad(m) == pytest.approx(4 * m.val)
+
+def test_cse_skips_partials():
+    x = Var(1.)
+    s1 = ops.sin(x)
+    s2 = ops.sin(x)
+    y = checkpoint(ops.exp, s1) + checkpoint(ops.exp, x) + checkpoint(ops.exp, x) + s2
+    assert optimize.eliminate_common_subexpressions(y) == 0
+    z = checkpoint(ops.exp, s1) + ops.exp(s2)
+    assert optimize.eliminate_common_subexpressions(z) == 0
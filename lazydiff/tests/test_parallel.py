@@ -0,0 +1,192 @@
+import pytest
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from lazydiff.vars import Var
+from lazydiff import ops
+from lazydiff import regression
+import functools
+from lazydiff.parallel import DataParallel, CrossValidation, cross_validate, levels, parallel_backward
+
+np.random.seed(0)
+X = np.random.rand(60, 3)
+y = X @ np.array([1., -2., 3.]) + 0.5
+
+@pytest.fixture(scope='module')
+def pool():
+    with DataParallel(X, y, processes=2, shards=3) as dp:
+        yield dp
+
+@pytest.mark.parametrize('loss_function', [regression.MSE, regression.lasso_loss, regression.elastic_loss])
+def test_gradient_matches_serial(pool, loss_function):
+    m = Var(np.ones(3))
+    b = Var(0.)
+    loss = loss_function(X, y, m, b)
+    loss.backward()
+    parallel_loss, grad_m, grad_b = pool.gradient(loss_function, m, b)
+    assert parallel_loss == pytest.approx(loss.val)
+    assert grad_m == pytest.approx(loss.grad(m))
+    assert grad_b == pytest.approx(loss.grad(b))
+
+def test_gradient_sum(pool):
+    m = Var(np.ones(3))
+    b = Var(0.)
+    loss = regression._squared_residuals(X, y, m, b)
+    loss.backward()
+    parallel_loss, grad_m, grad_b = pool.gradient(regression._squared_residuals, m, b, reduce='sum')
+    assert parallel_loss == pytest.approx(loss.val)
+    assert grad_m == pytest.approx(loss.grad(m))
+    assert grad_b == pytest.approx(loss.grad(b))
+
+def test_gradient_rejects_inexact_reduce(pool):
+    m = Var(np.ones(3))
+    b = Var(0.)
+    for reduce in ('mean', 'sum'):
+        with pytest.raises(ValueError):
+            pool.gradient(regression.ridge_loss, m, b, reduce=reduce)
+        with pytest.raises(ValueError):
+            pool.wrap(functools.partial(regression.ridge_loss, C=0.1), reduce=reduce)
+    with pytest.raises(ValueError):
+        pool.gradient(regression.MSE, m, b, reduce='max')
+
+@pytest.mark.parametrize('forward', [True, False])
+def test_gradient_descent(pool, forward):
+    m = Var(np.ones(3))
+    b = Var(0.)
+    m1, b1, loss1 = regression.gradient_descent(X, y, regression.MSE, m, b, forward=forward)
+    m2, b2, loss2 = regression.gradient_descent(X, y, pool.wrap(regression.MSE), m, b, forward=forward)
+    assert loss2.val == pytest.approx(loss1.val)
+    assert m2.val == pytest.approx(m1.val)
+    assert b2.val == pytest.approx(b1.val)
+
+def test_iterative_regression(pool):
+    m = Var(np.zeros(3))
+    b = Var(0.)
+    m, b, loss = regression.iterative_regression(X, y, m, b, pool.wrap(regression.MSE), lr=0.5, epochs=300)
+    assert m.val == pytest.approx([1., -2., 3.], abs=1e-1)
+
+def test_wrap_rejects_other_data(pool):
+    with pytest.raises(ValueError):
+        pool.wrap(regression.MSE)(X[:10], y[:10], Var(np.ones(3)), Var(0.))
+
+def test_shard_gradient_in_process():
+    from lazydiff import parallel
+    X_block, X_description = parallel._share(X)
+    y_block, y_description = parallel._share(y)
+    try:
+        parallel._init_worker(X_description, y_description)
+        loss, grad_m, grad_b = parallel._shard_gradient((regression.MSE, 0, 20, np.ones(3), 0.))
+        m = Var(np.ones(3))
+        b = Var(0.)
+        expected = regression.MSE(X[:20], y[:20], m, b)
+        expected.backward()
+        assert loss == pytest.approx(expected.val)
+        assert grad_m == pytest.approx(expected.grad(m))
+    finally:
+        for name in ('X_block', 'y_block'):
+            parallel._shared.pop(name).close()
+        parallel._shared.clear()
+        for block in (X_block, y_block):
+            block.close()
+            block.unlink()
+
+@pytest.fixture(scope='module')
+def folds():
+    with CrossValidation(X, y, folds=3, processes=2, seed=0) as cv:
+        yield cv
+
+def test_cross_validation_matches_serial(folds):
+    result = folds.evaluate(regression.MSE, Var(np.zeros(3)), Var(0.), lr=0.5, epochs=50)
+    order = np.random.default_rng(0).permutation(len(y))
+    X_shuffled, y_shuffled = X[order], y[order]
+    for i, (start, stop) in enumerate(folds.folds):
+        train = np.r_[0:start, stop:len(y)]
+        m, b, loss = regression.iterative_regression(X_shuffled[train], y_shuffled[train], Var(np.zeros(3)),
+                                                     Var(0.), regression.MSE, lr=0.5, epochs=50)
+        score = regression.MSE(X_shuffled[start:stop], y_shuffled[start:stop], m, b)
+        assert result['loss'][i] == pytest.approx(loss.val)
+        assert result['score'][i] == pytest.approx(score.val)
+        assert result['m'][i] == pytest.approx(m.val)
+        assert result['b'][i] == pytest.approx(b.val)
+    assert np.all(result['time'] > 0)
+
+def test_cross_validation_search(folds):
+    candidates = [functools.partial(regression.lasso_loss, C=C) for C in (1., 0.01)]
+    results = folds.search(candidates, Var(np.ones(3)), Var(0.), score_function=regression.MSE, epochs=20)
+    assert len(results) == 2
+    for candidate, result in zip(candidates, results):
+        single = folds.evaluate(candidate, Var(np.ones(3)), Var(0.), score_function=regression.MSE, epochs=20)
+        assert result['score'] == pytest.approx(single['score'])
+    assert results[1]['score'].mean() < results[0]['score'].mean()
+
+def test_cross_validate():
+    result = cross_validate(X, y, regression.MSE, Var(np.zeros(3)), Var(0.), folds=4, processes=2,
+                            lr=0.5, epochs=300)
+    assert result['m'].shape == (4, 3)
+    assert result['m'] == pytest.approx(np.tile([1., -2., 3.], (4, 1)), abs=1e-1)
+    assert result['score'] == pytest.approx(np.zeros(4), abs=1e-2)
+
+@pytest.mark.parametrize('count', [1, 61])
+def test_cross_validation_rejects_folds(count):
+    with pytest.raises(ValueError):
+        CrossValidation(X, y, folds=count)
+
+def test_fit_fold_in_process():
+    from lazydiff import parallel
+    X_block, X_description = parallel._share(X)
+    y_block, y_description = parallel._share(y)
+    try:
+        parallel._init_worker(X_description, y_description)
+        options = {'lr': 0.5, 'epochs': 10}
+        loss, score, m_val, b_val, elapsed = parallel._fit_fold((regression.MSE, regression.MSE, 0, 20,
+                                                                 np.zeros(3), 0., options))
+        m, b, expected = regression.iterative_regression(X[20:], y[20:], Var(np.zeros(3)), Var(0.),
+                                                         regression.MSE, **options)
+        assert loss == pytest.approx(expected.val)
+        assert m_val == pytest.approx(m.val)
+        assert score == pytest.approx(regression.MSE(X[:20], y[:20], m, b).val)
+    finally:
+        for name in ('X_block', 'y_block'):
+            parallel._shared.pop(name).close()
+        parallel._shared.clear()
+        for block in (X_block, y_block):
+            block.close()
+            block.unlink()
+
+def wide_graph(x):
+    branches = [ops.sin(x * k) ** 2 for k in range(1, 5)]
+    total = branches[0]
+    for branch in branches[1:]:
+        total = total + branch
+    return ops.sum(total + ops.exp(x))
+
+def test_levels():
+    x = Var([1., 2.])
+    y = ops.sin(x) + x
+    grouped = levels(y)
+    assert grouped[0] == [y]
+    assert len(grouped) == 3
+    assert grouped[2] == [x]
+
+@pytest.mark.parametrize('min_size', [0, 3, 10**6])
+def test_parallel_backward(min_size):
+    x1 = Var(np.linspace(0, 1, 5))
+    y1 = wide_graph(x1)
+    y1.backward()
+    x2 = Var(np.linspace(0, 1, 5))
+    y2 = wide_graph(x2)
+    with ThreadPoolExecutor(2) as executor:
+        parallel_backward(y2, executor, min_size=min_size)
+    assert y2.grad(x2) == pytest.approx(y1.grad(x1))
+
+def test_parallel_backward_set_value():
+    x = Var(1.)
+    y = ops.exp(x)
+    x.set_value(2.)
+    parallel_backward(y, min_size=0)
+    assert y.grad(x) == pytest.approx(np.exp(2.))
+
+def test_parallel_backward_default_executor():
+    x = Var(2.)
+    y = ops.exp(x) * x
+    parallel_backward(y, min_size=0)
+    assert y.grad(x) == pytest.approx(3 * np.exp(2.))
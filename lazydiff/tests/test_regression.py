@@ -1,12 +1,12 @@
 import pytest
 from pytest import approx
-from lazydiff.vars import Var
+from lazydiff.vars import Var, gradients
 from lazydiff import ops
 from lazydiff import regression
 
 import numpy as np
 from sklearn.datasets import make_regression
-from sklearn.linear_model import LinearRegression, Lasso, Ridge, ElasticNet
+from sklearn.linear_model import LinearRegression, Lasso, Ridge, ElasticNet, LogisticRegression, PoissonRegressor
 from sklearn.preprocessing import PolynomialFeatures
 
 np.random.seed(1)
@@ -131,3 +131,206 @@ def test_store():
     assert history['m'][-1] == m.val
     assert history['b'][-1] == b.val
     assert history['loss'][-1] == loss.val
+
+def test_sparse():
+    scipy_sparse = pytest.importorskip('scipy.sparse')
+    X_sparse = scipy_sparse.csr_matrix(X * (np.arange(len(X)) % 2)[:, None])
+    m = Var(np.ones(X.shape[1]))
+    b = Var(0)
+    loss = regression.MSE(X_sparse, y, m, b)
+    dense_loss = regression.MSE(X_sparse.toarray(), y, m, b)
+    assert loss.val == approx(dense_loss.val)
+    loss.backward()
+    dense_loss.backward()
+    assert loss.grad(m) == approx(dense_loss.grad(m))
+    assert loss.grad(b) == approx(dense_loss.grad(b))
+
+def test_gradient_descent_in_place():
+    m = Var(np.ones(X.shape[1]))
+    b = Var(0)
+    expected_m, expected_b, _ = regression.gradient_descent(X, y, regression.MSE, Var(m.val), Var(b.val))
+    new_m, new_b, loss = regression.gradient_descent(X, y, regression.MSE, m, b, in_place=True)
+    assert new_m is m and new_b is b
+    assert m.val == approx(expected_m.val)
+    assert b.val == approx(expected_b.val)
+    assert not m.children and not b.children
+
+def test_iterative_regression_in_place():
+    m = Var(np.ones(X.shape[1]))
+    b = Var(0)
+    new_m, new_b, loss = regression.iterative_regression(X, y, m, b, regression.MSE, 0.1, 100,
+                                                         1e-8, False, in_place=True)
+    clf = LinearRegression().fit(X,y)
+    assert new_m is m
+    assert m.val == approx(clf.coef_, abs=1e-3)
+    assert b.val == approx(clf.intercept_, abs=1e-3)
+
+def test_gradient_descent_modes():
+    m = Var(np.ones(X.shape[1]))
+    b = Var(0)
+    results = [regression.gradient_descent(X, y, regression.MSE, Var(m.val), Var(b.val), forward=forward)
+               for forward in (True, False, None)]
+    for new_m, new_b, _ in results[1:]:
+        assert new_m.val == approx(results[0][0].val)
+        assert new_b.val == approx(results[0][1].val)
+
+def test_monitor():
+    m = Var(np.ones(X.shape[1]))
+    b = Var(0)
+    monitor = regression.Monitor(1000, rtol=1e-10, patience=3, every=2)
+    m, b, loss = regression.iterative_regression(X, y, m, b, regression.MSE, 0.1, 1000,
+                                                 0, False, callback=monitor)
+    history = monitor.history()
+    assert monitor.reason == 'rtol'
+    assert history['epoch'][-1] < 999
+    assert np.all(np.diff(history['epoch']) == 2)
+    assert history['m'].shape == (monitor.count, X.shape[1])
+    assert m.val == approx(LinearRegression().fit(X,y).coef_, abs=1e-3)
+
+def test_monitor_gtol():
+    m = Var(np.ones(X.shape[1]))
+    b = Var(0)
+    monitor = regression.Monitor(1000, gtol=1e-3)
+    regression.iterative_regression(X, y, m, b, regression.MSE, 0.1, 1000, 0, False, callback=monitor)
+    assert monitor.reason == 'gtol'
+    assert monitor.count < 1000
+
+def test_monitor_vector_intercept():
+    y_s = np.digitize(y, np.percentile(y, [33, 66]))
+    m = Var(np.zeros((X.shape[1], 3)))
+    b = Var(np.zeros(3))
+    monitor = regression.Monitor(20)
+    m, b, loss = regression.iterative_regression(X, y_s, m, b, regression.softmax_loss, 0.1, 20,
+                                                 0, False, callback=monitor)
+    history = monitor.history()
+    assert history['m'].shape == (20, X.shape[1], 3)
+    assert history['b'].shape == (20, 3)
+    assert np.all(history['b'][-1] == b.val)
+
+def test_line_search():
+    clf = LinearRegression().fit(X,y)
+    for step, lr in (('armijo', 10.), ('bb', 0.1)):
+        m = Var(np.ones(X.shape[1]))
+        b = Var(0)
+        monitor = regression.Monitor(500, gtol=1e-6)
+        m, b, loss = regression.iterative_regression(X, y, m, b, regression.MSE, lr, 500,
+                                                     0, False, callback=monitor, step=step)
+        assert monitor.reason == 'gtol'
+        assert m.val == approx(clf.coef_, abs=1e-3)
+        assert b.val == approx(clf.intercept_, abs=1e-3)
+
+def test_line_search_in_place():
+    m = Var(np.ones(X.shape[1]))
+    b = Var(0)
+    new_m, new_b, loss = regression.iterative_regression(X, y, m, b, regression.MSE, 0.1, 50,
+                                                         0, False, in_place=True, step='bb')
+    assert new_m is m and new_b is b
+    assert m.val == approx(LinearRegression().fit(X,y).coef_, abs=1e-3)
+    with pytest.raises(ValueError):
+        regression.iterative_regression(X, y, m, b, regression.MSE, step='newton')
+
+def test_logistic_loss():
+    X_c = X / X.std()
+    y_c = (y > np.median(y)).astype(float)
+    y_c[:10] = 1 - y_c[:10]
+    m = Var(np.zeros(X.shape[1]))
+    b = Var(0)
+    m, b, loss = regression.iterative_regression(X_c, y_c, m, b, regression.logistic_loss, 1., 200,
+                                                 0, False, step='bb')
+    clf = LogisticRegression(C=1e10).fit(X_c, y_c)
+    assert m.val == approx(clf.coef_[0], abs=1e-3)
+    assert b.val == approx(clf.intercept_[0], abs=1e-3)
+
+def test_poisson_loss():
+    y_p = np.random.poisson(np.exp(0.5 * X[:, 0] + 1))
+    m = Var(np.zeros(X.shape[1]))
+    b = Var(0)
+    m, b, loss = regression.iterative_regression(X, y_p, m, b, regression.poisson_loss, 0.1, 300,
+                                                 0, False, step='bb')
+    clf = PoissonRegressor(alpha=0).fit(X, y_p)
+    assert m.val == approx(clf.coef_, abs=1e-3)
+    assert b.val == approx(clf.intercept_, abs=1e-3)
+
+def test_softmax_loss():
+    y_s = np.digitize(y, np.percentile(y, [33, 66]))
+    m = Var(np.zeros((X.shape[1], 3)))
+    b = Var(np.zeros(3))
+    loss = regression.softmax_loss(X, y_s, m, b)
+    assert loss.val == approx(np.log(3))
+    grad_m, grad_b = gradients(loss, [m, b], 'forward')
+    assert grad_b == approx(np.array([1 / 3 - np.mean(y_s == k) for k in range(3)]))
+    assert np.all(np.shape(grad_m) == (X.shape[1], 3))
+
+def test_regularization_path():
+    import scipy.sparse
+    X_sparse = scipy.sparse.csr_matrix(X)
+    Cs = [0.01, 1, 0.1]
+    path = regression.regularization_path(X_sparse, y, regression.elastic_loss, Cs, Var(np.ones(dim)), Var(0.),
+                                          lr = 0.5, epochs = 2000, tol = 1e-12)
+    assert list(path['C']) == [1, 0.1, 0.01]
+    for C, m, b in zip(path['C'], path['m'], path['b']):
+        clf = ElasticNet(alpha = C).fit(X, y)
+        assert m == approx(clf.coef_, abs=1e-3)
+        assert b == approx(clf.intercept_, abs=1e-3)
+    cold = regression.regularization_path(X_sparse, y, regression.elastic_loss, [0.01], Var(np.ones(dim)),
+                                          Var(0.), lr = 0.5, epochs = 2000, tol = 1e-12)
+    assert path['epochs'][-1] < cold['epochs'][0]
+    assert path['m'][-1] == approx(cold['m'][0], abs=1e-6)
+
+def test_linear_model_predict():
+    import scipy.sparse
+    X_w = np.random.rand(50, 4)
+    y_w = X_w @ np.array([1., -2., 0.5, 3.]) + 1 + 0.1 * np.random.rand(50)
+    clf = LinearRegression().fit(X_w, y_w)
+    model = regression.LinearModel(Var(clf.coef_), Var(clf.intercept_))
+    assert model.predict(X_w) == approx(clf.predict(X_w))
+    assert model.predict(X_w, chunk_size=7) == approx(clf.predict(X_w))
+    assert model.predict(scipy.sparse.csr_matrix(X_w), chunk_size=7) == approx(clf.predict(X_w))
+    assert model.score(X_w, y_w) == approx(clf.score(X_w, y_w))
+
+def test_linear_model_fit():
+    import scipy.sparse
+    model = regression.LinearModel.fit(scipy.sparse.csr_matrix(X), y, regression.MSE, Var(np.zeros(dim)), Var(0.),
+                                       lr=0.5, epochs=300)
+    assert model.m == approx([true_coef], abs=1e-3)
+    assert model.score(X, y) == approx(1.)
+
+def test_linear_model_links():
+    from sklearn.metrics import d2_tweedie_score
+    X_c = X / X.std()
+    y_c = (y > np.median(y)).astype(float)
+    y_c[:10] = 1 - y_c[:10]
+    clf = LogisticRegression().fit(X_c, y_c)
+    model = regression.LinearModel(clf.coef_[0], clf.intercept_[0], link='logistic')
+    assert model.predict(X_c, chunk_size=30) == approx(clf.predict_proba(X_c)[:, 1])
+    assert model.score(X_c, y_c) == approx(clf.score(X_c, y_c))
+    y_p = np.random.poisson(np.exp(0.5 * X[:, 0] + 1))
+    y_p[:5] = 0
+    clf = PoissonRegressor().fit(X, y_p)
+    model = regression.LinearModel(clf.coef_, clf.intercept_, link='exp')
+    assert model.predict(X) == approx(clf.predict(X))
+    assert model.score(X, y_p) == approx(d2_tweedie_score(y_p, clf.predict(X), power=1))
+    y_s = np.digitize(y, np.percentile(y, [33, 66]))
+    clf = LogisticRegression().fit(X, y_s)
+    model = regression.LinearModel(clf.coef_.T, clf.intercept_, link='softmax')
+    assert model.predict(X, chunk_size=30) == approx(clf.predict_proba(X))
+    assert model.score(X, y_s) == approx(clf.score(X, y_s))
+    with pytest.raises(ValueError):
+        regression.LinearModel(clf.coef_.T, clf.intercept_, link='probit')
+
+def test_polynomial_features():
+    X_p = np.random.default_rng(0).uniform(-1, 1, (20, 2))
+    y_p = 1 + X_p[:, 0] - 2 * X_p[:, 0] * X_p[:, 1] + 3 * X_p[:, 1] ** 2
+    features = regression.Polynomial(X_p, 2, chunk_size=8)
+    assert features.shape == (20, 5)
+    expanded = PolynomialFeatures(2, include_bias = False).fit_transform(X_p)
+    m = Var(np.zeros(5))
+    b = Var(0.)
+    loss = regression.MSE(features, y_p, m, b)
+    assert loss.val == approx(np.mean(y_p ** 2))
+    assert gradients(loss, [m, b], 'forward')[0] == approx(gradients(regression.MSE(expanded, y_p, m, b),
+                                                                     [m, b], 'reverse')[0])
+    model = regression.LinearModel.fit(features, y_p, regression.MSE, m, b, lr = 0.5, epochs = 300,
+                                       forward = False, step = 'bb')
+    assert model.m == approx(LinearRegression().fit(expanded, y_p).coef_, abs=1e-4)
+    assert model.predict(features, chunk_size = 6) == approx(y_p, abs=1e-4)
@@ -0,0 +1,132 @@
+import io
+import pytest
+import numpy as np
+from lazydiff import ops
+from lazydiff import serialize
+from lazydiff.vars import Var
+from lazydiff.checkpointing import checkpoint
+
+def build():
+    m = Var([1., 2., 3.])
+    b = Var(0.5, seed=2.)
+    loss = ops.sum(ops.sin(m) * np.array([1., -1., 2.]) + b) ** 2
+    return loss, m, b
+
+def test_save_load_values(tmp_path):
+    loss, m, b = build()
+    path = str(tmp_path / 'graph.npz')
+    serialize.save(path, loss, m, b)
+    loss2, m2, b2 = serialize.load(path)
+    assert loss2.val == loss.val
+    assert np.all(m2.val == m.val)
+    assert b2.val == b.val
+
+def test_save_load_backward(tmp_path):
+    loss, m, b = build()
+    loss.backward()
+    path = str(tmp_path / 'graph.npz')
+    serialize.save(path, loss, m, b)
+    loss2, m2, b2 = serialize.load(path)
+    loss2.backward()
+    assert np.all(loss2.grad(m2) == loss.grad(m))
+    assert np.all(loss2.grad(b2) == loss.grad(b))
+
+def test_save_load_forward(tmp_path):
+    loss, m, b = build()
+    b.forward()
+    path = str(tmp_path / 'graph.npz')
+    serialize.save(path, loss, m, b)
+    loss2, m2, b2 = serialize.load(path)
+    b2.forward()
+    assert np.all(loss2.grad(b2) == loss.grad(b))
+
+def test_save_load_dtypes(tmp_path):
+    x = Var(np.array([1., 2.], dtype=np.float32))
+    w = Var([0.5, 0.25])
+    z = Var(np.array([1j, 2.]))
+    y = x * w
+    c = y * z
+    path = str(tmp_path / 'graph.npz')
+    serialize.save(path, c, y, x, w, z)
+    loaded = serialize.load(path)
+    for var, var2 in zip((c, y, x, w, z), loaded):
+        assert var2.val.dtype == var.val.dtype
+        assert var2.grad_val[var2].dtype == var.grad_val[var].dtype
+        assert np.all(var2.val == var.val)
+    c2, y2, x2, w2, z2 = loaded
+    assert x2.children[y2].dtype == x.children[y].dtype
+    y2.backward()
+    assert y2.grad(x2).dtype == np.float32
+
+def test_load_memory_mapped(tmp_path):
+    loss, m, b = build()
+    path = str(tmp_path / 'graph.npz')
+    serialize.save(path, loss, m)
+    loss2, m2 = serialize.load(path)
+    assert isinstance(m2.val.base, np.memmap)
+    loss3, m3 = serialize.load(path, mmap_mode=None)
+    assert not isinstance(m3.val.base, np.memmap)
+    assert np.all(m3.val == m2.val)
+
+def test_save_load_file_object():
+    loss, m, b = build()
+    f = io.BytesIO()
+    serialize.save(f, loss, m, b)
+    f.seek(0)
+    loss2, m2, b2 = serialize.load(f)
+    loss2.backward()
+    assert loss2.val == loss.val
+    assert b2.grad_val[b2] == 2.
+
+def test_save_invalid_input(tmp_path):
+    with pytest.raises(TypeError):
+        serialize.save(str(tmp_path / 'graph.npz'), 1.)
+
+def test_save_checkpoint_fails(tmp_path):
+    x = Var(1.)
+    y = checkpoint(ops.sin, x)
+    with pytest.raises(ValueError):
+        serialize.save(str(tmp_path / 'graph.npz'), y)
+
+def test_load_compressed(tmp_path):
+    loss, m, b = build()
+    path = str(tmp_path / 'graph.npz')
+    serialize.save(path, loss, m, b)
+    with np.load(path) as archive:
+        arrays = dict(archive)
+    np.savez_compressed(path, **arrays)
+    loss2, m2, b2 = serialize.load(path)
+    assert not isinstance(m2.val.base, np.memmap)
+    assert loss2.val == loss.val
+
+def test_save_load_single_var(tmp_path):
+    path = str(tmp_path / 'graph.npz')
+    serialize.save(path, Var([1., 2.]))
+    x, = serialize.load(path)
+    assert np.all(x.val == [1., 2.])
+    assert x.parents == {}
+
+@pytest.mark.parametrize('sparse', [False, True])
+def test_save_load_regression_loss(tmp_path, sparse):
+    import scipy.sparse
+    from lazydiff import regression
+    X = np.random.rand(8, 3)
+    y = (np.random.rand(8) > 0.5).astype(float)
+    X = scipy.sparse.csr_matrix(X) if sparse else X
+    m = Var([0.5, -1., 2.])
+    b = Var(0.1)
+    loss = regression.logistic_loss(X, y, m, b)
+    loss.backward()
+    path = str(tmp_path / 'graph.npz')
+    serialize.save(path, loss, m, b)
+    loss2, m2, b2 = serialize.load(path)
+    loss2.backward()
+    assert loss2.val == pytest.approx(loss.val)
+    assert loss2.grad(m2) == pytest.approx(loss.grad(m))
+    assert loss2.grad(b2) == pytest.approx(loss.grad(b))
+
+def test_save_polynomial_fails(tmp_path):
+    m = Var(np.ones(5))
+    y = ops.polynomial_matmul(np.random.rand(4, 2), m)
+    with pytest.raises(ValueError):
+        serialize.save(str(tmp_path / 'graph.npz'), y)
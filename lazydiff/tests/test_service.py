@@ -0,0 +1,116 @@
+import asyncio
+import pytest
+import numpy as np
+import lazydiff
+from lazydiff import ops
+from lazydiff.vars import Var
+from lazydiff.service import GradientService, agrad, evaluate
+
+def price(spot, vol):
+    return spot * ops.exp(vol ** 2 / 2)
+
+def test_evaluate():
+    val, (grad_spot, grad_vol) = evaluate(price, [2., 0.5])
+    assert val == pytest.approx(2 * np.exp(0.125))
+    assert grad_spot == pytest.approx(np.exp(0.125))
+    assert grad_vol == pytest.approx(2 * 0.5 * np.exp(0.125))
+
+def test_evaluate_unused_input():
+    val, grads = evaluate(lambda x, y: ops.sin(x), [0., 1.])
+    assert grads[1] == 0
+
+def test_shared_var_keeps_no_children():
+    rate = Var(0.05)
+    discounted = lambda spot: spot * ops.exp(-rate)
+    service = GradientService()
+
+    async def run():
+        return await asyncio.gather(*[service.grad(discounted, [spot]) for spot in range(200)])
+
+    results = asyncio.run(run())
+    for spot, (val, (grad_spot,)) in enumerate(results):
+        assert val == pytest.approx(spot * np.exp(-0.05))
+        assert grad_spot == pytest.approx(np.exp(-0.05))
+    assert rate.children == {}
+
+def test_batches_concurrent_requests():
+    service = GradientService(max_batch_size=100)
+    spots = np.linspace(1, 2, 10)
+
+    async def run():
+        return await asyncio.gather(*[service.grad(price, [spot, 0.5], batch=True) for spot in spots])
+
+    results = asyncio.run(run())
+    for spot, (val, grads) in zip(spots, results):
+        expected_val, expected_grads = evaluate(price, [spot, 0.5])
+        assert val == pytest.approx(expected_val)
+        assert grads == pytest.approx(expected_grads)
+    metrics = service.metrics()
+    assert metrics['requests'] == 10
+    assert metrics['batches'] == 1
+    assert metrics['mean_batch_size'] == 10
+    assert metrics['pending'] == 0
+    assert metrics['max_latency'] >= metrics['mean_latency'] >= metrics['mean_queue_time'] >= 0
+
+def test_max_batch_size():
+    service = GradientService(max_batch_size=4)
+
+    async def run():
+        return await asyncio.gather(*[service.grad(price, [spot, 0.5], batch=True) for spot in range(10)])
+
+    asyncio.run(run())
+    assert service.metrics()['batches'] == 3
+
+def test_non_elementwise_function_falls_back():
+    service = GradientService()
+    total = lambda x: ops.sum(x) * 1
+
+    async def run():
+        return await asyncio.gather(*[service.grad(total, [x], batch=True) for x in [1., 2.]])
+
+    results = asyncio.run(run())
+    assert [val for val, _ in results] == [1., 2.]
+
+def test_vector_inputs_not_batched():
+    service = GradientService()
+
+    async def run():
+        return await asyncio.gather(*[service.grad(ops.sum, [[1., x]], batch=True) for x in [1., 2.]])
+
+    results = asyncio.run(run())
+    assert [val for val, _ in results] == [2., 3.]
+    assert service.metrics()['batches'] == 2
+
+def test_not_batched_by_default():
+    service = GradientService()
+    coupled = lambda x: x * ops.sum(x)
+
+    async def run():
+        return await asyncio.gather(*[service.grad(coupled, [x]) for x in [1., 2., 3.]])
+
+    results = asyncio.run(run())
+    assert [val for val, _ in results] == [1., 4., 9.]
+    assert [grads[0] for _, grads in results] == [2., 4., 6.]
+    assert service.metrics()['batches'] == 3
+
+def test_error_only_fails_request():
+    service = GradientService()
+
+    def fn(x):
+        if np.any(x.val == 0):
+            raise ValueError('invalid input')
+        return 1 / x
+
+    async def run():
+        return await asyncio.gather(*[service.grad(fn, [x], batch=True) for x in [0., 2.]], return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert isinstance(results[0], ValueError)
+    assert results[1][0] == 0.5
+    assert service.metrics()['errors'] == 1
+
+def test_agrad():
+    assert lazydiff.agrad is agrad
+    val, grads = asyncio.run(agrad(ops.sin, [0.]))
+    assert val == 0
+    assert grads == [1]
@@ -0,0 +1,84 @@
+import pytest
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from lazydiff import ops
+from lazydiff.vars import Var, Tape
+from lazydiff.jacobian import jacobian
+from lazydiff.parallel import parallel_backward
+
+def test_tape_keeps_shared_var_clean():
+    m = Var([1., 2.])
+    with Tape() as tape:
+        y = ops.sum(ops.sin(m))
+        y.backward()
+    assert y.grad(m) == pytest.approx(np.cos(m.val))
+    assert m.children == {}
+    assert len(tape.children[m]) == 1
+
+def test_tape_forward_inside_tape():
+    m = Var(2.)
+    with Tape():
+        y = m * 3
+        m.forward()
+    assert y.grad(m) == 3
+
+def test_tape_forward_order_not_cached():
+    m = Var(2.)
+    for factor in range(3):
+        with Tape():
+            y = m * factor
+            m.forward()
+        assert y.grad(m) == factor
+    assert not m._orders
+    y = m * 4
+    m.forward()
+    assert y.grad(m) == 4
+    assert len(m._orders) == 1
+
+def test_tape_backward_after_leaving_tape():
+    w = Var(2.)
+    with Tape():
+        loss = w * 3.
+        y = ops.exp(w) * w
+    loss.backward()
+    assert loss.grad(w) == 3
+    parallel_backward(y, min_size=0)
+    assert y.grad(w) == pytest.approx(3 * np.exp(2.))
+    J = jacobian([loss, y], [w], mode='reverse')
+    assert J.toarray().ravel() == pytest.approx([3, 3 * np.exp(2.)])
+    assert w.children == {}
+
+def test_tape_owned_vars_use_own_children():
+    with Tape():
+        x = Var(2.)
+        y = ops.exp(x)
+    assert y in x.children
+
+def test_nested_tapes_restore_previous():
+    m = Var(1.)
+    with Tape() as outer:
+        with Tape() as inner:
+            m * 2
+        m * 3
+    assert len(inner.children[m]) == 1
+    assert len(outer.children[m]) == 1
+    assert m.children == {}
+
+def test_threads_share_parameters():
+    m = Var(np.linspace(0, 1, 1000))
+    b = Var(0.5)
+
+    def grad(scale):
+        with Tape():
+            loss = ops.sum(ops.sin(m * scale) + b) ** 2
+            loss.backward()
+            return loss.grad(m), loss.grad(b)
+
+    scales = np.linspace(1, 2, 16)
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(grad, scales))
+    for scale, (grad_m, grad_b) in zip(scales, results):
+        loss = ops.sum(ops.sin(m * scale) + b) ** 2
+        loss.backward()
+        assert grad_m == pytest.approx(loss.grad(m))
+        assert grad_b == pytest.approx(loss.grad(b))
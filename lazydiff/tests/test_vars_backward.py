@@ -1,6 +1,7 @@
 import pytest
 import numpy as np
 from lazydiff.vars import Var
+from lazydiff import ops
 
 def test_init_var():
     var = Var(1)
@@ -275,3 +276,114 @@ def test_composite2():
     y = x2**x1 / x3
     y.backward()
     assert y.grad(x3) == -.008
+
+def test_deep_graph():
+    x = Var(1.)
+    y = x
+    for _ in range(5000):
+        y = y + 1
+    y.backward()
+    x.forward()
+    assert y.grad(x) == 1
+
+def test_cached_order_backward():
+    x = Var(2)
+    y = x * 3 + x ** 2
+    y.backward()
+    order = y._topological_order(False)
+    z = y * 2
+    y.backward()
+    assert y._topological_order(False) is order
+    assert y.grad(x) == 7
+
+def test_cached_order_forward_invalidated():
+    x = Var(2)
+    y = x * 3
+    x.forward()
+    order = x._topological_order(True)
+    z = x ** 2
+    x.forward()
+    assert x._topological_order(True) is not order
+    assert z.grad(x) == 4
+
+def test_set_value():
+    x = Var(2)
+    w = Var(3)
+    u = w ** 2
+    y = x * u + u
+    y.backward()
+    x.set_value(4)
+    assert 'val' in u.__dict__
+    assert y.val == 45
+    y.backward()
+    assert y.grad(x) == 9
+    assert y.grad(w) == 30
+
+def test_set_value_subtraction_division():
+    for backward_first in (False, True):
+        x = Var(2.)
+        y = Var(3.)
+        z = x / y - (1 - y) + 1 / x
+        if backward_first:
+            z.backward()
+        y.set_value(4.)
+        z.backward()
+        assert z.val == pytest.approx(4.)
+        assert z.grad(y) == pytest.approx(-2 / 16 + 1)
+        assert z.grad(x) == pytest.approx(1 / 4 - 1 / 4)
+        assert len(y.children) == 2
+
+def test_set_value_relinks_edges():
+    x = Var(2.)
+    w = Var(3.)
+    y = ops.sin(x * w)
+    y.backward()
+    for val in (4., 5.):
+        x.set_value(val)
+        y.backward()
+        assert y.grad(x) == pytest.approx(3 * np.cos(3 * val))
+    (node, factor), = y.parents.items()
+    assert node.children == {y: factor}
+    assert len(x.children) == len(w.children) == 1
+    assert x.children[node] is node.parents[x]
+
+def test_set_value_forward():
+    x = Var(2)
+    w = Var(3)
+    y = x * w + x ** 2
+    x.forward()
+    assert y.grad(x) == 7
+    w.set_value(5)
+    x.forward()
+    assert y.grad(x) == 9
+    x.set_value(1)
+    x.forward()
+    assert y.val == 6
+    assert y.grad(x) == 7
+    assert y._op is not None and x._op is None
+
+def test_set_value_errors():
+    x = Var(2)
+    y = x * 3
+    with pytest.raises(ValueError):
+        y.set_value(1)
+    z = Var(1.)
+    z.parents[x] = x.children[z] = 1.
+    with pytest.raises(ValueError):
+        x.set_value(1)
+    assert x.val == 2
+
+def test_detach_zero_grad():
+    x = Var(2)
+    y = x * 3
+    z = y ** 2
+    z.backward()
+    y.detach()
+    assert not x.children and not y.parents
+    assert y not in z.parents
+    w = x * 4
+    w.backward()
+    assert w.grad(x) == 4
+    assert z.grad(x) == 36
+    z.zero_grad()
+    assert list(z.grad_val) == [z]
@@ -1,6 +1,7 @@
 import pytest
 import numpy as np
-from lazydiff.vars import Var
+from lazydiff.vars import Var, Partial, gradients, set_default_dtype, get_default_dtype
+from lazydiff import ops
 
 def test_init_var_forward():
     var = Var(1)
@@ -159,3 +160,56 @@ def test_composite2():
     y = x2**x1 / x3
     x3.forward()
     assert y.grad(x3) == -.008
+
+def test_partial_base_not_implemented():
+    with pytest.raises(NotImplementedError):
+        Partial().jvp(1.)
+    with pytest.raises(NotImplementedError):
+        Partial().vjp(1.)
+
+def test_dtype_forward():
+    var1 = Var([1, 2], dtype='float32')
+    var2 = var1 * 3 + 1
+    var1.forward()
+    assert var2.val.dtype == np.float32
+    assert var2.grad(var1).dtype == np.float32
+    assert np.all(var2.grad(var1) == [3, 3])
+
+def test_default_dtype():
+    assert get_default_dtype() == np.float64
+    set_default_dtype('float32')
+    try:
+        assert Var(1).val.dtype == np.float32
+        assert Var(np.array([1.], dtype='float64')).val.dtype == np.float64
+        assert Var(1j).val.dtype == np.complex64
+    finally:
+        set_default_dtype('float64')
+    with pytest.raises(ValueError):
+        set_default_dtype('int64')
+
+def test_complex_step_forward():
+    h = 1e-20
+    var1 = Var(2 + 1j * h)
+    var2 = var1 ** 3
+    var1.forward()
+    assert var2.val.imag / h == pytest.approx(12)
+    assert var2.grad(var1).real == pytest.approx(12)
+
+def test_gradients_forward():
+    x = Var([1., 2.])
+    w = Var(3.)
+    z = ops.sum((x * w) ** 2) + w
+    grad_x, grad_w = gradients(z, [x, w], 'forward')
+    assert np.all(grad_x == [18, 36])
+    assert grad_w == 31
+
+def test_gradients_modes():
+    x = Var([1., 2.])
+    total = ops.sum(x ** 2 * 3) * 2
+    forward = gradients(total, [x], 'forward')
+    reverse = gradients(total, [x])
+    assert np.all(forward[0] == reverse[0])
+    with pytest.raises(ValueError):
+        gradients(total, [x], 'sideways')
+    with pytest.raises(ValueError):
+        gradients(Var(1.), [x], 'forward')
@@ -1,6 +1,7 @@
 import pytest
 import numpy as np
-from lazydiff.vars import Var
+from lazydiff.vars import Var, error_policy, set_error_policy, get_error_policy
+from lazydiff import ops
 
 def test_init_var():
     var = Var([1, 2, 3])
@@ -213,3 +214,36 @@ def test_composite2():
     y = x2**x1 / x3
     y.backward()
     assert np.all(y.grad(x3) == [-.008, -.001])
+
+def test_error_policy_ignore():
+    with error_policy('ignore'):
+        y = Var([1, 2]) / Var([0., 1.])
+    assert np.all(y.val == [np.inf, 2])
+    with pytest.raises(FloatingPointError):
+        Var([1, 2]) / Var([0., 1.])
+
+def test_error_policy_mask():
+    x = Var([0., 1., 4.])
+    with error_policy('mask'):
+        y = ops.sum(ops.sqrt(x))
+        y.backward()
+    assert y.val == 3
+    assert np.all(y.grad(x) == [0, .5, .25])
+
+def test_error_policy_scoped():
+    assert get_error_policy() == 'raise'
+    assert np.geterr()['divide'] == 'warn'
+    with error_policy('warn'):
+        with pytest.warns(RuntimeWarning):
+            Var([1, 2]) / Var([0., 1.])
+    with pytest.raises(ValueError):
+        set_error_policy('skip')
+
+def test_error_policy_nested():
+    # composite operations apply the policy once for their inner operations
+    with pytest.raises(FloatingPointError):
+        Var([1, 2]) - Var([1., 1.]) ** -1 / Var([0., 1.])
+    with error_policy('ignore'):
+        y = Var([1, 2]) - Var([1, 2]) / Var([0., 1.])
+    assert np.all(y.val == [-np.inf, 0])
+    assert np.geterr()['divide'] == 'warn'
@@ -1,6 +1,6 @@
 import pytest
 from lazydiff import ops
-from lazydiff.vars import Var
+from lazydiff.vars import Var, gradients
 import numpy as np
 
 def test_sin():
@@ -202,3 +202,230 @@ def test_composite_trig():
     x.forward()
     assert np.all(x2.val == pytest.approx(x3.val))
     assert np.all(x2.grad(x) == pytest.approx(x3.grad(x)))
+
+def test_softplus():
+    var1 = Var([0, 0])
+    var2 = ops.softplus(var1)
+    var2.backward()
+    assert var2.val == pytest.approx([np.log(2), np.log(2)])
+    assert var2.grad(var1) == pytest.approx([.5, .5])
+
+def test_logsumexp():
+    var1 = Var([1, 2, 3])
+    var2 = ops.logsumexp(var1)
+    var2.backward()
+    assert var2.val == pytest.approx(np.log(np.sum(np.exp([1, 2, 3]))))
+    assert var2.grad(var1) == pytest.approx(np.exp([1, 2, 3]) / np.sum(np.exp([1, 2, 3])))
+
+def test_logsumexp_stable():
+    var1 = Var([1000, 1000])
+    var2 = ops.logsumexp(var1)
+    var2.backward()
+    assert var2.val == pytest.approx(1000 + np.log(2))
+    assert var2.grad(var1) == pytest.approx([.5, .5])
+
+def test_norm_l1():
+    var1 = Var([-1, 0, 3])
+    var2 = ops.norm(var1)
+    var2.backward()
+    assert var2.val == 4
+    assert np.all(var2.grad(var1) == [-1, 0, 1])
+
+def test_squared_error():
+    var1 = Var([1, 2, 3])
+    var2 = ops.squared_error(var1, [0, 2, 5])
+    var2.backward()
+    assert var2.val == 5
+    assert np.all(var2.grad(var1) == [2, 0, -4])
+
+def test_matmul():
+    A = np.array([[1., 2.], [3., 4.], [5., 6.]])
+    var1 = Var([1, -1])
+    var2 = ops.sum(ops.matmul(A, var1))
+    var2.backward()
+    assert var2.val == -3
+    assert np.all(var2.grad(var1) == [9, 12])
+
+def test_matmul_matrix_var():
+    var1 = Var([[1., 2.], [3., 4.]])
+    var2 = ops.sum(ops.matmul(var1, np.array([1., -1.])) ** 2)
+    var2.backward()
+    assert var2.val == 2
+    assert np.all(var2.grad(var1) == [[-2, 2], [-2, 2]])
+
+def test_matmul_forward_error():
+    var1 = Var([1, -1])
+    var2 = ops.matmul(np.eye(2), var1)
+    with pytest.raises(ValueError):
+        var1.forward()
+
+def test_matmul_sparse_constant():
+    scipy_sparse = pytest.importorskip('scipy.sparse')
+    A = scipy_sparse.csr_matrix([[1., 0.], [0., 2.], [3., 0.]])
+    var1 = Var([1, 2])
+    var2 = ops.sum(ops.matmul(A, var1))
+    var2.backward()
+    assert var2.val == 8
+    assert np.all(var2.grad(var1) == [4, 2])
+
+def test_matmul_sparse_var():
+    scipy_sparse = pytest.importorskip('scipy.sparse')
+    var1 = Var(scipy_sparse.csr_matrix([[1., 0.], [0., 2.]]))
+    var2 = ops.sum(ops.matmul(var1, np.array([1., 3.])) ** 2)
+    var2.backward()
+    grad = var2.grad(var1)
+    assert scipy_sparse.issparse(grad)
+    assert grad.nnz == 2
+    assert np.all(grad.toarray() == [[2, 0], [0, 36]])
+
+def test_sum_sparse():
+    scipy_sparse = pytest.importorskip('scipy.sparse')
+    var1 = Var(scipy_sparse.csr_matrix([[1., 0.], [0., 2.]]))
+    var2 = ops.sum(var1)
+    var2.backward()
+    assert var2.val == 3
+    assert np.all(var2.grad(var1).toarray() == [[1, 0], [0, 1]])
+
+def test_broadcast_to():
+    var1 = Var(2)
+    var2 = ops.sum(ops.broadcast_to(var1, (3,)) * np.array([1., 2., 3.]))
+    var2.backward()
+    assert var2.val == 12
+    assert var2.grad(var1) == 6
+
+def test_matmul_batched_forward():
+    A = np.array([[1., 2.], [3., 4.], [5., 6.]])
+    var1 = Var([1, -1])
+    var2 = ops.sum(ops.matmul(A, var1) ** 2)
+    grad, = gradients(var2, [var1], 'forward')
+    assert np.all(grad == 2 * A.T @ (A @ [1, -1]))
+
+def test_binary_cross_entropy():
+    var1 = Var([0., 1000., -1000.])
+    var2 = ops.binary_cross_entropy(var1, [1, 1, 0])
+    var2.backward()
+    assert var2.val == pytest.approx(np.log(2))
+    assert var2.grad(var1) == pytest.approx([-.5, 0, 0])
+
+def test_poisson_nll():
+    var1 = Var([0., np.log(2)])
+    var2 = ops.poisson_nll(var1, [1, 3])
+    var2.backward()
+    assert var2.val == pytest.approx(3 - 3 * np.log(2))
+    assert var2.grad(var1) == pytest.approx([0, -1])
+
+def test_softmax_cross_entropy():
+    var1 = Var([[0., 0.], [1000., 0.]])
+    var2 = ops.softmax_cross_entropy(var1, [1, 0])
+    var2.backward()
+    assert var2.val == pytest.approx(np.log(2))
+    assert var2.grad(var1) == pytest.approx(np.array([[.5, -.5], [0, 0]]))
+    var3 = ops.softmax_cross_entropy(var1, [[0., 1.], [1., 0.]])
+    assert var3.val == pytest.approx(var2.val)
+
+@pytest.mark.parametrize('degree, interaction_only', [(1, False), (2, False), (3, False), (3, True)])
+def test_polynomial_matmul(degree, interaction_only):
+    from sklearn.preprocessing import PolynomialFeatures
+    X = np.random.rand(11, 3)
+    expanded = PolynomialFeatures(degree, interaction_only=interaction_only, include_bias=False).fit_transform(X)
+    assert len(ops.polynomial_terms(3, degree, interaction_only)) == expanded.shape[1]
+    m = Var(np.random.rand(expanded.shape[1]))
+    result = ops.polynomial_matmul(X, m, degree, interaction_only, chunk_size=4)
+    assert result.val == pytest.approx(expanded @ m.val)
+    loss = ops.sum(result ** 2)
+    expected = 2 * expanded.T @ (expanded @ m.val)
+    assert gradients(loss, [m], 'reverse')[0] == pytest.approx(expected)
+    assert gradients(loss, [m], 'forward')[0] == pytest.approx(expected)
+
+def test_polynomial_matmul_matrix():
+    import scipy.sparse
+    from sklearn.preprocessing import PolynomialFeatures
+    X = np.random.rand(9, 2)
+    expanded = PolynomialFeatures(2, include_bias=False).fit_transform(X)
+    m = Var(np.random.rand(expanded.shape[1], 3))
+    result = ops.polynomial_matmul(scipy.sparse.csr_matrix(X), m, chunk_size=2)
+    assert result.val == pytest.approx(expanded @ m.val)
+    cotangent = np.random.rand(9, 3)
+    loss = ops.sum(result * cotangent)
+    loss.backward()
+    assert loss.grad(m) == pytest.approx(expanded.T @ cotangent)
+    with pytest.raises(ValueError):
+        ops.polynomial_matmul(X, Var(np.ones(4)))
+
+calls = {'solve': 0, 'vjp': 0}
+
+def _solve_jvp(tangents, x, A, b):
+    dA, db = tangents
+    rhs = (0 if db is None else db) - (0 if dA is None else dA @ x)
+    return np.linalg.solve(A, rhs)
+
+def _solve_vjp(cotangent, x, A, b):
+    calls['vjp'] += 1
+    grad_b = np.linalg.solve(A.T, cotangent)
+    return -np.outer(grad_b, x), grad_b
+
+@ops.custom_op(jvp=_solve_jvp, vjp=_solve_vjp)
+def solve(A, b):
+    """
+    Solves the linear system Ax = b
+    """
+    calls['solve'] += 1
+    return np.linalg.solve(A, b)
+
+def test_custom_op():
+    A_val = np.array([[4., 1., 0.], [1., 3., 1.], [0., 1., 2.]])
+    A = Var(A_val)
+    b = Var([1., 2., 3.])
+    x = solve(A, b)
+    assert x.val == pytest.approx(np.linalg.solve(A_val, b.val))
+    assert solve.__doc__.strip() == 'Solves the linear system Ax = b'
+    weights = np.array([1., -1., 2.])
+    loss = ops.sum(x * weights)
+    grad_b = np.linalg.solve(A_val.T, weights)
+    calls['vjp'] = 0
+    reverse_A, reverse_b = gradients(loss, [A, b], 'reverse')
+    assert calls['vjp'] == 1
+    assert reverse_b == pytest.approx(grad_b)
+    assert reverse_A == pytest.approx(-np.outer(grad_b, x.val))
+    forward_A, forward_b = gradients(loss, [A, b], 'forward')
+    assert forward_b == pytest.approx(grad_b)
+    assert forward_A == pytest.approx(reverse_A)
+
+def test_custom_op_constants_and_recompute():
+    A_val = np.diag([2., 4.])
+    b = Var([2., 4.])
+    x = solve(A_val, b)
+    loss = ops.sum(x ** 2)
+    assert x.val == pytest.approx([1., 1.])
+    b.set_value([4., 8.])
+    assert loss.val == pytest.approx(8.)
+    loss.backward()
+    assert loss.grad(b) == pytest.approx([2., 1.])
+
+def test_custom_op_repeated_argument():
+    product = ops.custom_op(lambda x, y: x * y,
+                            jvp=lambda tangents, result, x, y: (0 if tangents[0] is None else tangents[0] * y) +
+                                                               (0 if tangents[1] is None else x * tangents[1]),
+                            vjp=lambda cotangent, result, x, y: (cotangent * y, cotangent * x))
+    x = Var([1., 2.])
+    square = product(x, x)
+    assert square.val == pytest.approx([1., 4.])
+    square.backward()
+    assert square.grad(x) == pytest.approx([2., 4.])
+    assert gradients(ops.sum(product(x, x)), [x], 'forward')[0] == pytest.approx([2., 4.])
+
+def test_custom_op_missing_rule():
+    double = ops.custom_op(lambda x: 2 * x, vjp=lambda cotangent, result, x: (2 * cotangent,))
+    x = Var([1., 2.])
+    y = double(x)
+    y.backward()
+    assert y.grad(x) == pytest.approx([2., 2.])
+    with pytest.raises(ValueError):
+        x.forward()
+    half = ops.custom_op(lambda x: x / 2, jvp=lambda tangents, result, x: tangents[0] / 2)
+    x = Var([1., 2.])
+    y = half(x)
+    x.forward()
+    assert y.grad(x) == pytest.approx([0.5, 0.5])
+    with pytest.raises(ValueError):
+        half(x).backward()
@@ -1,28 +1,434 @@
 import numpy as np
 import collections
+import functools
 import numbers
+import sys
+import threading
 
-np.seterr(all='raise')
+_default_dtype = np.dtype('float64')
+
+_created = 0
+_edits = 0
+_changes = 0
+
+def _graph_changed():
+    """
+    Invalidates the cached topological orders of all variables. Needs to be
+    called after removing or adding edges between existing variables.
+    """
+    global _edits
+    _edits += 1
+
+def set_default_dtype(dtype):
+    """
+    Sets the dtype of the values of variables created from Python numbers,
+    lists or integer arrays, float64 unless changed. Values that already are
+    floating point or complex numpy arrays keep their dtype, so results of
+    operations have the dtype of their inputs.
+    """
+    global _default_dtype
+    dtype = np.dtype(dtype)
+    if not np.issubdtype(dtype, np.inexact):
+        raise ValueError('Default dtype needs to be a floating point or complex dtype.')
+    _default_dtype = dtype
+
+def get_default_dtype():
+    """
+    Returns the dtype set by set_default_dtype
+    """
+    return _default_dtype
+
+def _resolve_dtype(val, dtype=None):
+    """
+    Returns the dtype of the value of a variable created from val with the
+    given dtype, or with the default policy if dtype is None
+    """
+    if dtype is not None:
+        return np.dtype(dtype)
+    val_dtype = getattr(val, 'dtype', None)
+    if val_dtype is not None and np.issubdtype(val_dtype, np.inexact):
+        return val_dtype
+    if np.iscomplexobj(val):
+        return np.result_type(_default_dtype, np.complex64)
+    return _default_dtype
+
+class _Local(threading.local):
+    """
+    Thread-local state holding the tape and the floating point error policy
+    active in the current thread, and the policy applied to numpy by the
+    outermost _errstate, if any
+    """
+    tape = None
+    errors = None
+    applied = None
+
+_local = _Local()
+
+_error_policy = 'raise'
+
+def _check_policy(policy):
+    """
+    Raises error unless policy is a floating point error policy
+    """
+    if policy not in ('raise', 'warn', 'ignore', 'mask'):
+        raise ValueError("Error policy needs to be 'raise', 'warn', 'ignore' or 'mask'.")
+
+def set_error_policy(policy):
+    """
+    Sets how floating point errors such as division by zero, overflow and
+    invalid operations are handled by lazydiff operations in all threads
+    without an error_policy of their own. With 'raise', the default, they
+    raise FloatingPointError, with 'warn' they emit a RuntimeWarning and with
+    'ignore' they produce inf or nan silently. 'mask' ignores them and also
+    drops non-finite derivatives in forward and backward, so that invalid
+    components of a vector do not spoil the derivatives of the others.
+    NumPy's own error handling outside of lazydiff is not changed.
+    """
+    global _error_policy
+    _check_policy(policy)
+    _error_policy = policy
+
+def get_error_policy():
+    """
+    Returns the floating point error policy active in the current thread
+    """
+    return _local.errors or _error_policy
+
+class error_policy:
+    """
+    Context manager setting the floating point error policy of lazydiff
+    operations in the current thread, see set_error_policy
+    """
+
+    def __init__(self, policy):
+        """
+        Initializes context manager for policy
+        """
+        _check_policy(policy)
+        self.policy = policy
+        self.previous = None
+
+    def __enter__(self):
+        """
+        Activates policy in the current thread
+        """
+        self.previous = _local.errors
+        _local.errors = self.policy
+        return self
+
+    def __exit__(self, *args):
+        """
+        Restores the policy that was active before
+        """
+        _local.errors = self.previous
+
+class _errstate:
+    """
+    Context manager applying floating point error policy, by default the
+    active policy, to numpy. numpy.errstate is only entered if numpy does
+    not already handle errors as the policy requires, which is the case
+    inside another _errstate for the same policy.
+    """
+
+    def __init__(self, policy=None):
+        """
+        Initializes context manager for policy
+        """
+        self.policy = policy or get_error_policy()
+        self.state = None
+        self.previous = None
+
+    def __enter__(self):
+        """
+        Applies the policy to numpy in the current thread
+        """
+        self.previous = _local.applied
+        if self.previous != self.policy:
+            setting = 'ignore' if self.policy == 'mask' else self.policy
+            errors = np.geterr()
+            if not (errors['divide'] == errors['over'] == errors['under'] == errors['invalid'] == setting):
+                self.state = np.errstate(all=setting)
+                self.state.__enter__()
+        _local.applied = self.policy
+        return self
+
+    def __exit__(self, *args):
+        """
+        Restores the error handling of numpy from before
+        """
+        _local.applied = self.previous
+        if self.state is not None:
+            self.state.__exit__(*args)
+
+def _apply_policy(operation, args, kwargs):
+    """
+    Calls operation under the active floating point error policy, unless it
+    is called from another operation that already applied it
+    """
+    policy = get_error_policy()
+    previous = _local.applied
+    if previous == policy:
+        # nested in an operation or sweep that already applied the policy
+        return operation(*args, **kwargs)
+    _local.applied = policy
+    try:
+        with np.errstate(all='ignore' if policy == 'mask' else policy):
+            return operation(*args, **kwargs)
+    finally:
+        _local.applied = previous
+
+def _operation(operation):
+    """
+    Decorator for functions computing a new variable from their arguments.
+    Runs operation under the active floating point error policy and records
+    it with its arguments on results computed from variables, so that the
+    result can be recomputed after set_value changes one of its inputs.
+    """
+    @functools.wraps(operation)
+    def recorded(*args, **kwargs):
+        result = _apply_policy(operation, args, kwargs)
+        if result.parents:
+            result._op = (recorded, args, kwargs)
+        return result
+    return recorded
+
+def _composite(operation):
+    """
+    Decorator for functions combining other operations, which record
+    themselves. Applies the floating point error policy once for all of
+    them, without recording the combination, since recomputing it would
+    create new intermediate variables.
+    """
+    @functools.wraps(operation)
+    def composite(*args, **kwargs):
+        return _apply_policy(operation, args, kwargs)
+    return composite
+
+def _mask(grad):
+    """
+    Returns derivative grad with its non-finite components replaced by zero
+    """
+    if _issparse(grad):
+        grad = grad.copy()
+        grad.data[~np.isfinite(grad.data)] = 0
+        return grad
+    return np.where(np.isfinite(grad), grad, 0)
+
+class Tape:
+    """
+    Records the graph built in the current thread.
+    While a tape is active, the edges from variables created outside of it,
+    such as shared parameters, to the variables computed from them are kept in
+    the tape rather than in the shared variables. Several threads can then
+    build and differentiate graphs over the same variables concurrently, each
+    inside its own tape. backward follows the edges stored on the computed
+    variables, so it also works after leaving the tape, but forward mode
+    from a shared variable only sees the edges of the active tape, so it
+    needs to run inside the tape.
+    """
+
+    def __init__(self):
+        """
+        Initializes empty tape
+        """
+        self.children = {}
+        self.previous = None
+
+    def __enter__(self):
+        """
+        Activates tape in the current thread
+        """
+        self.previous = _local.tape
+        _local.tape = self
+        return self
+
+    def __exit__(self, *args):
+        """
+        Restores the tape that was active before
+        """
+        _local.tape = self.previous
+
+class Partial:
+    """
+    Base class for partial derivatives that cannot be stored as a plain
+    numerical factor. Subclasses implement jvp, which is used by forward,
+    and vjp, which is used by backward.
+    """
+
+    def jvp(self, tangent):
+        """
+        Returns the contribution of the parent's derivative tangent to the
+        derivative of the child.
+        """
+        raise NotImplementedError
+
+    def vjp(self, cotangent):
+        """
+        Returns the contribution of the child's derivative cotangent to the
+        derivative of the parent.
+        """
+        raise NotImplementedError
+
+def _issparse(val):
+    """
+    Returns True if val is a scipy.sparse matrix. Does not import scipy, since
+    sparse matrices can only exist once it has been imported.
+    """
+    sparse = sys.modules.get('scipy.sparse')
+    return sparse is not None and sparse.issparse(val)
+
+def _jvp(factor, tangent):
+    """
+    Applies partial derivative factor to tangent in forward mode
+    """
+    if isinstance(factor, Partial):
+        return factor.jvp(tangent)
+    return factor * tangent
+
+def _vjp(factor, cotangent):
+    """
+    Applies partial derivative factor to cotangent in reverse mode
+    """
+    if isinstance(factor, Partial):
+        return factor.vjp(cotangent)
+    return factor * cotangent
 
 class Var:
     """
     A class for lazydiff autograd scalar variables.
     """
 
-    def __init__(self, val, seed=np.array(1.)):
+    _orders = None
+    _op = None
+
+    def __init__(self, val, seed=np.array(1.), dtype=None):
         """
         Initializes Var object with numerical value val.
-        """
-        self.val = np.array(val, dtype='float')
-        self.grad_val = {self: seed}
+        The value and seed are stored with dtype, which by default is the
+        dtype of val if it is a floating point or complex numpy array, and
+        the one set by set_default_dtype otherwise.
+        Sparse matrices from scipy.sparse are kept sparse; they can be used
+        with ops.matmul and ops.sum, but not with elementwise operations.
+        """
+        global _created
+        _created += 1
+        dtype = _resolve_dtype(val, dtype)
+        self.val = val.astype(dtype) if _issparse(val) else np.array(val, dtype=dtype)
+        self.grad_val = {self: np.asarray(seed, dtype=dtype)}
         self.parents = {}
-        self.children = {}
+        self._children = {}
+        self._tape = _local.tape
+        self._refreshed = _changes
+
+    @property
+    def children(self):
+        """
+        Returns dictionary mapping the variables computed from this variable to
+        the partial derivatives of those variables with respect to this one.
+        Inside a tape the variable was not created in, the dictionary is the
+        one kept by the tape.
+        """
+        tape = _local.tape
+        if tape is None or tape is self._tape:
+            return self._children
+        return tape.children.setdefault(self, {})
 
     def __repr__(self):
         """
         Returns string representation of Var object
         """
-        return 'Var({}, seed={})'.format(repr(self.val.tolist()), repr(self.grad_val[self].tolist()))
+        val = self.val.toarray() if _issparse(self.val) else self.val
+        return 'Var({}, seed={})'.format(repr(val.tolist()), repr(self.grad_val[self].tolist()))
+
+    def __getattr__(self, name):
+        """
+        Recomputes the value of the variable if it was invalidated by
+        set_value. Only called for attributes that are not set.
+        """
+        if name != 'val':
+            raise AttributeError("'Var' object has no attribute '{}'".format(name))
+        self._refresh()
+        return self.__dict__['val']
+
+    def set_value(self, val):
+        """
+        Changes the value of this variable, which needs to be an input that
+        was not computed from other variables. The variables computed from it
+        are marked as outdated, and their values and partial derivatives are
+        recomputed when they are next used, so only the affected part of the
+        graph is recomputed. Derivatives need to be propagated again with
+        forward or backward afterwards.
+        Raises error if an affected variable cannot be recomputed, like
+        variables created directly rather than by lazydiff operations.
+        """
+        if self.parents:
+            raise ValueError('Only the value of an input variable can be changed.')
+        order = self._topological_order(True)
+        for var in order:
+            if var is not self and var._op is None:
+                raise ValueError('Variable depending on this variable cannot be recomputed.')
+        val = val.astype(self.val.dtype) if _issparse(val) else np.array(val, dtype=self.val.dtype)
+        global _changes
+        _changes += 1
+        for var in order:
+            var.__dict__.pop('val', None)
+        self.val = val
+
+    def zero_grad(self):
+        """
+        Removes the derivatives stored in this variable by forward and
+        backward, keeping only its seed
+        """
+        self.grad_val = {self: self.grad_val[self]}
+
+    def detach(self):
+        """
+        Removes the edges between this variable and its parents and the
+        variables computed from it, so that those graphs can be freed and
+        later calls to forward only see graphs built afterwards. Lets
+        parameters be reused across training steps instead of being
+        recreated.
+        """
+        for parent in self.parents.keys():
+            parent.children.pop(self, None)
+        for child in self.children.keys():
+            child.parents.pop(self, None)
+        self.parents.clear()
+        self.children.clear()
+        self.__dict__.pop('_op', None)
+        _graph_changed()
+
+    def _refresh(self):
+        """
+        Recomputes the outdated variables this variable depends on, including
+        itself, parents before children
+        """
+        if 'val' in self.__dict__:
+            return
+        outdated = []
+        seen = {self}
+        stack = [(self, iter(self.parents.keys()))]
+        while stack:
+            node, parents = stack[-1]
+            for parent in parents:
+                if parent not in seen and 'val' not in parent.__dict__:
+                    seen.add(parent)
+                    stack.append((parent, iter(parent.parents.keys())))
+                    break
+            else:
+                stack.pop()
+                outdated.append(node)
+        for node in outdated:
+            operation, args, kwargs = node._op
+            fresh = operation(*args, **kwargs)
+            for parent in node.parents.keys():
+                parent.children.pop(node, None)
+            node.parents.clear()
+            for parent, factor in fresh.parents.items():
+                parent.children.pop(fresh, None)
+                node.parents[parent] = parent.children[node] = factor
+            node.val = fresh.val
+        _graph_changed()
 
     def __hash__(self):
         """
@@ -49,26 +455,69 @@ class Var:
         seen nodes in the course of creating the topological order.
         """
         seen.add(var)
-        for child in var.children.keys():
-            if child not in seen:
-                self._forward_visit(child, top_sort, seen)
-        top_sort.appendleft(var)
+        stack = [(var, iter(var.children.keys()))]
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                if child not in seen:
+                    seen.add(child)
+                    stack.append((child, iter(child.children.keys())))
+                    break
+            else:
+                stack.pop()
+                top_sort.appendleft(node)
     
+    def _topological_order(self, forward):
+        """
+        Returns tuple of the variables reachable from this variable through
+        children if forward is True, or through parents otherwise, in the
+        order of _forward_visit or _backward_visit. The order is cached on
+        this variable. A forward order is reused until a new variable is
+        created, since it may be a child, and a backward order until edges
+        between existing variables change. Forward orders inside a tape are
+        not cached, since they would keep the graph of the tape alive.
+        """
+        cache = not forward or _local.tape is None
+        stamp = (_created, _edits) if forward else _edits
+        if self._orders is None:
+            self._orders = {}
+        cached = self._orders.get(forward)
+        if cache and cached is not None and cached[0] == stamp:
+            return cached[1]
+        top_sort = collections.deque()
+        if forward:
+            self._forward_visit(self, top_sort, set())
+        else:
+            self._backward_visit(self, top_sort, set())
+        order = tuple(top_sort)
+        if cache:
+            self._orders[forward] = (stamp, order)
+        return order
+
     def forward(self):
         """
         Propagates gradients forward from this variable.
         Before making any call var.grad(self), where var is a variable that
         depends on self, either need to run self.forward() or var.backward().
         """
-        top_sort = collections.deque()
-        self._forward_visit(self, top_sort, set())
-        for var in top_sort:
-            if not var is self:
-                grad = np.array(0.)
-                for parent, factor in var.parents.items():
-                    if self in parent.grad_val:
-                        grad = grad + factor * parent.grad_val[self]
-                var.grad_val[self] = grad
+        top_sort = self._topological_order(True)
+        if self._refreshed != _changes:
+            # variables are only outdated by set_value, so the partial
+            # derivatives are current if it was not called since last time
+            for var in top_sort:
+                var._refresh()
+            self._refreshed = _changes
+        mask = get_error_policy() == 'mask'
+        with _errstate():
+            for var in top_sort:
+                if not var is self:
+                    grad = np.zeros((), dtype=var.val.dtype)
+                    for parent, factor in var.parents.items():
+                        if self in parent.grad_val:
+                            grad = grad + _jvp(factor, parent.grad_val[self])
+                    if mask:
+                        grad = _mask(grad)
+                    var.grad_val[self] = grad.astype(var.val.dtype, copy=False)
 
     def _backward_visit(self, var, top_sort, seen):
         """
@@ -78,10 +527,17 @@ class Var:
         seen nodes in the course of creating the topological order.
         """
         seen.add(var)
-        for parent in var.parents.keys():
-            if parent not in seen:
-                self._backward_visit(parent, top_sort, seen)
-        top_sort.appendleft(var)
+        stack = [(var, iter(var.parents.keys()))]
+        while stack:
+            node, parents = stack[-1]
+            for parent in parents:
+                if parent not in seen:
+                    seen.add(parent)
+                    stack.append((parent, iter(parent.parents.keys())))
+                    break
+            else:
+                stack.pop()
+                top_sort.appendleft(node)
 
     def backward(self):
         """
@@ -89,15 +545,25 @@ class Var:
         Before making any call self.grad(var), where var is a variable on which
         self depends, either need to run self.backward() or var.forward().
         """
-        top_sort = collections.deque()
-        self._backward_visit(self, top_sort, set())
-        for var in top_sort:
-            if not var is self:
-                grad = np.array(0.) 
-                for child, factor in var.children.items():
-                    if child in self.grad_val:
-                        grad = grad + factor * self.grad_val[child]
-                self.grad_val[var] = grad 
+        self._refresh()
+        top_sort = self._topological_order(False)
+        mask = get_error_policy() == 'mask'
+        # the contributions are pushed along the edges stored on the
+        # children, which are the same inside and outside of a tape
+        pending = {}
+        with _errstate():
+            for var in top_sort:
+                if not var is self:
+                    grad = pending.pop(var)
+                    if mask:
+                        grad = _mask(grad)
+                    self.grad_val[var] = grad.astype(var.val.dtype, copy=False)
+                cotangent = self.grad_val[var]
+                for parent, factor in var.parents.items():
+                    grad = pending.get(parent)
+                    if grad is None:
+                        grad = np.zeros((), dtype=parent.val.dtype)
+                    pending[parent] = grad + _vjp(factor, cotangent)
 
     def _check_numeric(self, other):
         """
@@ -107,6 +573,7 @@ class Var:
             and np.issubdtype(other.dtype, np.number)):
             raise TypeError("Input needs to be numeric value, numpy array of numeric values, or Var object")
 
+    @_operation
     def __neg__(self):
         """
         Returns Var object representing negation of a Var object.
@@ -115,6 +582,7 @@ class Var:
         result.parents[self] = self.children[result] = -1.
         return result
 
+    @_operation
     def __abs__(self):
         """
         Returns Var object representing absolute value of a Var object.
@@ -123,6 +591,7 @@ class Var:
         result.parents[self] = self.children[result] = self.val / abs(self.val)
         return result
 
+    @_operation
     def __add__(self, other):
         """
         Returns Var object representing addition of two Var objects or
@@ -145,6 +614,7 @@ class Var:
         """
         return self + other
 
+    @_composite
     def __sub__(self, other):
         """
         Returns Var object representing subtraction of two Var objects or
@@ -152,6 +622,7 @@ class Var:
         """
         return self + (-other)
 
+    @_composite
     def __rsub__(self, other):
         """
         Returns Var object representing right subtraction of a Var object
@@ -159,6 +630,7 @@ class Var:
         """
         return -self + other
 
+    @_operation
     def __mul__(self, other):
         """
         Returns Var object representing multiplication of two Var objects 
@@ -181,6 +653,7 @@ class Var:
         """
         return self * other
 
+    @_composite
     def __truediv__(self, other):
         """
         Returns Var object representing division of two Var objects or 
@@ -188,6 +661,7 @@ class Var:
         """
         return self * (other ** -1)
 
+    @_composite
     def __rtruediv__(self, other):
         """
         Returns Var object representing right division of a Var object
@@ -195,6 +669,7 @@ class Var:
         """
         return (self ** -1) * other
 
+    @_operation
     def __pow__(self, other):
         """
         Returns Var object representing exponentiation of two Var objects 
@@ -210,6 +685,7 @@ class Var:
         result.parents[self] = self.children[result] = other * self.val ** (other - 1)
         return result
 
+    @_operation
     def __rpow__(self, other):
         """
         Returns Var object representing right exponentiation of a Var 
@@ -305,3 +781,64 @@ class Var:
         If other object is Var object, returns result of numpy comparison of their values.
         """
         return self._comparison(other, np.ndarray.__ge__)
+
+def _forward_batch(output, inputs):
+    """
+    Returns array holding the derivatives of scalar variable output along
+    every component of the variables inputs, stacked along its first axis.
+    Propagates one batch of tangents, the rows of an identity matrix split
+    between the inputs, in a single forward sweep over the graph of output.
+    """
+    sizes = [np.size(var.val) for var in inputs]
+    offsets = np.cumsum([0] + sizes)
+    tangents = {}
+    for var, start, stop in zip(inputs, offsets[:-1], offsets[1:]):
+        seed = np.zeros((offsets[-1], stop - start), dtype=var.val.dtype)
+        seed[start:stop] = np.eye(stop - start)
+        tangents[var] = seed.reshape((offsets[-1],) + var.val.shape)
+    output._refresh()
+    mask = get_error_policy() == 'mask'
+    with _errstate():
+        for var in reversed(output._topological_order(False)):
+            if var in tangents:
+                continue
+            grad = None
+            for parent, factor in var.parents.items():
+                if parent not in tangents:
+                    continue
+                tangent = tangents[parent]
+                pad = max(np.ndim(factor), var.val.ndim) - parent.val.ndim
+                if pad > 0 and not isinstance(factor, Partial):
+                    tangent = tangent.reshape(tangent.shape[:1] + (1,) * pad + parent.val.shape)
+                contribution = _jvp(factor, tangent)
+                extra = np.ndim(contribution) - 1 - var.val.ndim
+                if extra > 0:
+                    contribution = np.sum(contribution, axis=tuple(range(-extra, 0)))
+                grad = contribution if grad is None else grad + contribution
+            if grad is not None:
+                tangents[var] = _mask(grad) if mask else grad
+    if output not in tangents:
+        raise ValueError('Variable does not depend on inputs.')
+    return tangents[output]
+
+def gradients(output, inputs, mode=None):
+    """
+    Returns list of the gradients of scalar variable output with respect to
+    each of the variables inputs.
+    With mode 'forward', the gradients with respect to all components of the
+    inputs are computed in one forward sweep of a batch of tangents. With
+    mode 'reverse', they are computed by output.backward(). If mode is None,
+    reverse mode is used when the inputs have more components than output.
+    """
+    if np.ndim(output.val) != 0:
+        raise ValueError('Gradients are computed for scalar variables.')
+    if mode is None:
+        mode = 'reverse' if np.sum([np.size(var.val) for var in inputs]) > 1 else 'forward'
+    if mode == 'reverse':
+        output.backward()
+        return [output.grad(var) for var in inputs]
+    if mode != 'forward':
+        raise ValueError("Mode needs to be 'forward', 'reverse' or None.")
+    batch = _forward_batch(output, inputs)
+    sizes = np.cumsum([0] + [np.size(var.val) for var in inputs])
+    return [batch[start:stop].reshape(var.val.shape) for var, start, stop in zip(inputs, sizes[:-1], sizes[1:])]
@@ -8,6 +8,8 @@ setup(name='lazydiff',
       author_email='mzhangyb@gmail.com, josephddavison@gmail.com, rlin@college.harvard.edu, zhengyang@g.harvard.edu',
       license='MIT',
       packages=['lazydiff'],
-      install_requires=['numpy'],
+      python_requires='>=3.8',
+      install_requires=['numpy>=1.17'],
+      extras_require={'sparse': ['scipy']},
       setup_requires=['pytest-runner'],
-      tests_require=['pytest', 'pytest-cov', 'scikit-learn'],)
+      tests_require=['pytest', 'pytest-cov', 'scikit-learn', 'scipy'],)